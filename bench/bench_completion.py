@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""Compare parsers of completion (search suggestion) responses.
+
+``literal_eval`` is how ``loadSuggestions`` used to parse responses:
+strip the JSONP wrapper with ``str.replace`` and run
+:func:`ast.literal_eval` over the rest. ``parser`` is
+``audiSearch.parseCompletionResponse``.
+
+Usage::
+
+    python bench/bench_completion.py [RESPONSE ...]
+
+RESPONSE are files holding recorded response bodies. Without any, the
+``completion_*.txt`` responses in ``bench/fixtures`` are used, plus one
+generated response with 2000 metadata nodes to show how the parsers
+cope with a large payload.
+
+"""
+
+from __future__ import print_function
+
+import ast
+import io
+import os
+import sys
+
+from benchutil import best, fixtures, ms
+
+import audiSearch
+
+HEAD = (u'completion = ["har",["harry potter","harry potter and the '
+        u'sorcerer’s stone","harlan coben","harry bosch",'
+        u'"harry potter audiobooks narrated by jim dale"],[{"nodes":'
+        u'[{"alias":"audible","name":"Audible Audiobooks"}]}')
+NODE = u',{"nodes":[{"alias":"audible","name":"Audible Audiobooks"}]}'
+TAIL = u'],[]];updateACCompletion();'
+
+
+def literal_eval(body):
+    """Parse ``body`` the way ``loadSuggestions`` used to."""
+    body = body.replace('completion = ', '')
+    body = body.replace(';updateACCompletion();', '')
+    return ast.literal_eval(body)[1]
+
+
+def responses(paths):
+    """Yield ``(name, body)`` of responses to parse."""
+    for path in paths or fixtures('completion_*.txt'):
+        with io.open(path, encoding='utf-8') as fp:
+            yield os.path.basename(path), fp.read()
+
+    if not paths:
+        yield '2000 nodes', HEAD + NODE * 2000 + TAIL
+
+
+def main(paths):
+    """Time both parsers on each response."""
+    print('{0:<30} {1:>8} {2:>12} {3:>12}'.format(
+          'response', 'bytes', 'literal_eval', 'parser'))
+    for name, body in responses(paths):
+        expected = [s.decode('utf-8') if isinstance(s, str) else s
+                    for s in literal_eval(body)]
+        assert audiSearch.parseCompletionResponse(body) == expected, name
+
+        old = best(lambda: literal_eval(body), number=20)
+        new = best(lambda: audiSearch.parseCompletionResponse(body),
+                   number=20)
+        print('{0:<30} {1:>8} {2} {3}'.format(
+              name, len(body.encode('utf-8')), ms(old), ms(new)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
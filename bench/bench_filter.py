@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""Time :meth:`Workflow.filter` on lists and on a :class:`FilterIndex`.
+
+For 1k, 10k and 100k items, prints the time to build a
+:class:`FilterIndex` and the mean time per query of the queries typed
+while searching for a title, when filtering a plain list, an index and
+(if NumPy is installed) a vectorized index.
+
+Usage::
+
+    python bench/bench_filter.py [SIZE ...]
+
+"""
+
+from __future__ import print_function, unicode_literals
+
+import random
+import sys
+import time
+
+from benchutil import best, ms, workflow_env
+
+from workflow import FilterIndex, Workflow
+from workflow import workflow
+
+WORDS = ('Harry', 'Potter', 'and', 'the', 'Philosopher’s', 'Stone', 'Dune',
+         'Messiah', 'Children', 'of', 'House', 'Night', 'Café', 'Society',
+         'Brontë', 'Sisters', 'Sherlock', 'Holmes', 'A', 'Study', 'in',
+         'Scarlet', 'War', 'Peace', 'How', 'I', 'Met', 'Your', 'Mother',
+         'Über', 'Stephen', 'King', 'Long', 'Walk', 'Ærø', 'Odyssey', '2001')
+
+# What's typed while searching for "Harry Potter", plus two abbreviations
+QUERIES = ('h', 'ha', 'har', 'harr', 'harry', 'harry p', 'harry pot',
+           'hp', 'sh')
+
+
+def items(count):
+    """Return ``count`` titles."""
+    rand = random.Random(42)
+    return [' '.join(rand.choice(WORDS)
+                     for _ in range(rand.randint(1, 6)))
+            for _ in range(count)]
+
+
+def per_query(wf, items, repeat, **kwargs):
+    """Return mean time of filtering ``items`` with each of `QUERIES`."""
+    total = 0
+    for query in QUERIES:
+        total += best(lambda: wf.filter(query, items, **kwargs),
+                      repeat=repeat)
+    return total / len(QUERIES)
+
+
+def main(sizes):
+    """Run benchmark for each of ``sizes``."""
+    workflow_env()
+    wf = Workflow()
+    vectorized = workflow.numpy is not None
+
+    print('{0:>7} {1:>12}  {2:>12} {3:>12} {4:>12} {5:>12}'.format(
+          'items', 'build', 'list', 'index', 'index top10',
+          'numpy' if vectorized else '(no numpy)'))
+
+    for size in sizes:
+        data = items(size)
+        repeat = 3 if size <= 10000 else 1
+
+        start = time.time()
+        index = FilterIndex(data, vectorize=False)
+        build = time.time() - start
+
+        row = [
+            per_query(wf, data, repeat),
+            per_query(wf, index, repeat),
+            per_query(wf, index, repeat, max_results=10),
+        ]
+        if vectorized:
+            row.append(per_query(wf, FilterIndex(data), repeat))
+
+        print('{0:>7} {1}  {2}'.format(
+              size, ms(build), ' '.join(ms(t) for t in row)))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000])
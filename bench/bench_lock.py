@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""Measure :class:`~workflow.workflow.LockFile` under contention.
+
+``flock`` is :class:`~workflow.workflow.LockFile`. ``polling`` is the
+previous implementation, which created the lock file with ``O_EXCL`` and
+polled for it every 50 ms. It has no shared mode, so its "shared"
+readers exclude each other.
+
+Usage::
+
+    python bench/bench_lock.py [PROCESSES [ACQUISITIONS]]
+
+"""
+
+from __future__ import print_function
+
+import errno
+import multiprocessing
+import os
+import sys
+import time
+
+from benchutil import workflow_env
+
+from workflow.workflow import AcquisitionError, LockFile
+
+
+class PollingLock(object):
+    """The previous :class:`LockFile`, for comparison."""
+
+    def __init__(self, protected_path, timeout=0, delay=0.05, shared=False):
+        self.lockfile = protected_path + '.lock'
+        self.timeout = timeout
+        self.delay = delay
+
+    def acquire(self):
+        start = time.time()
+        while True:
+            try:
+                fd = os.open(self.lockfile,
+                             os.O_CREAT | os.O_EXCL | os.O_RDWR)
+                with os.fdopen(fd, 'w') as fp:
+                    fp.write('{0}'.format(os.getpid()))
+                return True
+            except OSError as err:
+                if err.errno != errno.EEXIST:
+                    raise
+                if self.timeout and time.time() - start >= self.timeout:
+                    raise AcquisitionError('Lock acquisition timed out.')
+                time.sleep(self.delay)
+
+    def release(self):
+        os.unlink(self.lockfile)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, typ, value, traceback):
+        self.release()
+
+
+LOCKS = (('flock', LockFile), ('polling', PollingLock))
+
+
+def worker(lock_class, path, shared, count, hold, results):
+    """Acquire the lock ``count`` times, holding it for ``hold`` seconds."""
+    waits = []
+    for _ in range(count):
+        start = time.time()
+        with lock_class(path, shared=shared):
+            waits.append(time.time() - start)
+            time.sleep(hold)
+    results.put(waits)
+
+
+def contend(lock_class, path, processes, count, hold, shared=False):
+    """Return ``(wall time, mean wait, max wait)`` of ``processes``."""
+    results = multiprocessing.Queue()
+    jobs = [multiprocessing.Process(
+            target=worker,
+            args=(lock_class, path, shared, count, hold, results))
+            for _ in range(processes)]
+    start = time.time()
+    for job in jobs:
+        job.start()
+    waits = []
+    for job in jobs:
+        waits.extend(results.get())
+    for job in jobs:
+        job.join()
+    return time.time() - start, sum(waits) / len(waits), max(waits)
+
+
+def crashed_holder(lock_class, path):
+    """Return seconds to acquire a lock whose holder died holding it."""
+    pid = os.fork()
+    if pid == 0:  # child
+        lock_class(path).acquire()
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+    start = time.time()
+    lock = lock_class(path, timeout=1)
+    try:
+        lock.acquire()
+    except AcquisitionError:
+        return None
+    lock.release()
+    return time.time() - start
+
+
+def main(processes=4, count=50):
+    """Run benchmarks with each lock implementation."""
+    tempdir = workflow_env()
+    print('{0} processes x {1} acquisitions'.format(processes, count))
+    print('{0:<8} {1:<24} {2:>8} {3:>11} {4:>11}'.format(
+          'lock', 'scenario', 'wall', 'mean wait', 'max wait'))
+
+    scenarios = (
+        ('exclusive, no work', 0, False),
+        ('exclusive, 1 ms work', 0.001, False),
+        ('shared, 1 ms work', 0.001, True),
+    )
+    for name, lock_class in LOCKS:
+        # LockFile leaves its lock file behind, which `PollingLock`
+        # would take to be held
+        path = os.path.join(tempdir, name)
+        for scenario, hold, shared in scenarios:
+            wall, mean, worst = contend(lock_class, path, processes,
+                                        count, hold, shared)
+            print('{0:<8} {1:<24} {2:7.3f}s {3:9.2f}ms {4:9.2f}ms'.format(
+                  name, scenario, wall, mean * 1000, worst * 1000))
+
+    for name, lock_class in LOCKS:
+        took = crashed_holder(lock_class, os.path.join(tempdir, name))
+        print('{0:<8} lock of a crashed holder: {1}'.format(
+              name, 'timed out after 1s' if took is None else
+              'acquired in {0:.3f} ms'.format(took * 1000)))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""Compare the registered serializers on catalog search responses.
+
+Prints dump and load latency and file size for every serializer
+registered with :data:`workflow.manager`.
+
+Usage::
+
+    python bench/bench_serializers.py [RESPONSE ...]
+
+RESPONSE are files holding recorded (JSON) catalog search responses.
+Without any, the ``catalog_*.json`` responses in ``bench/fixtures`` are
+used.
+
+"""
+
+from __future__ import print_function, unicode_literals
+
+import json
+import os
+import sys
+
+from benchutil import best, fixtures, ms, workflow_env
+
+from workflow import manager
+
+
+def responses(paths):
+    """Yield ``(name, response)`` to serialize."""
+    for path in paths or fixtures('catalog_*.json'):
+        with open(path) as fp:
+            yield os.path.basename(path), json.load(fp)
+
+
+def main(paths):
+    """Time every serializer on each response."""
+    tempdir = workflow_env()
+    path = os.path.join(tempdir, 'response')
+
+    for name, response in responses(paths):
+        print('{0} ({1} bytes as JSON)'.format(
+              name, len(json.dumps(response))))
+        print('  {0:<10} {1:>12} {2:>12} {3:>9}'.format(
+              'serializer', 'dump', 'load', 'bytes'))
+        for format in manager.serializers:
+            serializer = manager.serializer(format)
+
+            def dump():
+                with open(path, 'wb') as fp:
+                    serializer.dump(response, fp)
+
+            def load():
+                with open(path, 'rb') as fp:
+                    return serializer.load(fp)
+
+            dumped = best(dump, number=10)
+            assert load() == response, format
+            loaded = best(load, number=10)
+            print('  {0:<10} {1} {2} {3:>9}'.format(
+                  format, ms(dumped), ms(loaded), os.path.getsize(path)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""Shared set-up for the benchmark scripts in this directory.
+
+Run the scripts from anywhere with the Python the workflow uses, e.g.
+``python bench/bench_filter.py``.
+
+"""
+
+from __future__ import print_function
+
+import atexit
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, 'src')
+#: Recorded responses, see ``record_fixtures.py``
+FIXTURES = os.path.join(ROOT, 'bench', 'fixtures')
+
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+
+def workflow_env():
+    """Point :class:`~workflow.Workflow` at temporary directories.
+
+    :returns: path of the temporary directory (deleted on exit)
+    :rtype: ``str``
+
+    """
+    tempdir = tempfile.mkdtemp(prefix='aw-bench-')
+    atexit.register(shutil.rmtree, tempdir, True)
+    os.environ.setdefault('alfred_workflow_bundleid', 'net.deanishe.bench')
+    os.environ['alfred_workflow_cache'] = os.path.join(tempdir, 'cache')
+    os.environ['alfred_workflow_data'] = os.path.join(tempdir, 'data')
+    return tempdir
+
+
+def fixtures(pattern):
+    """Return paths of the files in :data:`FIXTURES` matching ``pattern``."""
+    return sorted(glob.glob(os.path.join(FIXTURES, pattern)))
+
+
+def best(func, number=1, repeat=5):
+    """Return best time in seconds per call of ``func``.
+
+    :param number: calls per timing
+    :param repeat: number of timings
+
+    """
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def ms(seconds):
+    """Format ``seconds`` as milliseconds."""
+    return '{0:9.3f} ms'.format(seconds * 1000)
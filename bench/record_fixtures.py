@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""Record catalog and completion responses into ``bench/fixtures``.
+
+For each QUERY, saves the body of the first page of catalog search
+results as ``catalog_<query>.json`` and that of the auto-complete
+request as ``completion_<query>.txt``, requested with the same
+parameters as ``audiSearch.py``. Existing files are overwritten.
+
+Usage::
+
+    python bench/record_fixtures.py QUERY [QUERY ...]
+
+"""
+
+from __future__ import print_function
+
+import os
+import re
+import sys
+
+from benchutil import FIXTURES
+
+from workflow import web
+
+CATALOG_URL = 'https://api.audible.com/1.0/catalog/products'
+COMPLETION_URL = 'https://completion.amazon.com/search/complete'
+
+
+def catalog_params(query):
+    """Parameters of ``audiSearch.loadSearchResults``."""
+    return {
+        'keywords': query,
+        'num_results': 10,
+        'language': 'en',
+        'products_sort_by': 'Relevance',
+        'image_sizes': 64,
+        'response_groups': 'media,product_desc,contributors,product_attrs',
+        'page': 0,
+    }
+
+
+def completion_params(query):
+    """Parameters of ``audiSearch.fetchSuggestions``."""
+    return {
+        'method': 'completion',
+        'q': query,
+        'search-alias': 'marketplace',
+        'client': 'audible-search@amazon.com',
+        'mkt': '91470',
+        'x': 'updateACCompletion',
+        'sc': '1',
+    }
+
+
+def record(url, params, path):
+    """Save the body of the response to ``url`` to ``path``."""
+    r = web.get(url, params)
+    r.raise_for_status()
+    with open(path, 'wb') as fp:
+        fp.write(r.content)
+    print('{0} ({1} bytes)'.format(path, len(r.content)))
+
+
+def main(queries):
+    """Record responses for each of ``queries``."""
+    if not queries:
+        print(__doc__.strip())
+        return 1
+
+    if not os.path.isdir(FIXTURES):
+        os.makedirs(FIXTURES)
+
+    for query in queries:
+        name = re.sub(r'\W+', '_', query.lower()).strip('_')
+        record(CATALOG_URL, catalog_params(query),
+               os.path.join(FIXTURES, 'catalog_{0}.json'.format(name)))
+        record(COMPLETION_URL, completion_params(query),
+               os.path.join(FIXTURES, 'completion_{0}.txt'.format(name)))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
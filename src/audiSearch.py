@@ -1,7 +1,10 @@
  # encoding: utf-8
 
-import sys, json, ast, shutil, os
+import sys, json, re, os, time, hashlib, mmap, struct, socket, urllib2
 from workflow import Workflow3, ICON_ERROR, ICON_INFO, ICON_SYNC, web
+from workflow.workflow import SQLiteStore
+from workflow.cache import CacheManager, Namespace
+from workflow.background import run_in_background
 
 intervals = (
 	('hrs', 3600),
@@ -9,8 +12,82 @@ intervals = (
 	('secs', 1)
 )
 numResultsPerPage = 10
+# Every network request, cover download and cache clean-up in a Script
+# Filter run shares one wall-clock budget (in seconds). Once it runs out,
+# cached or placeholder data is shown instead of waiting on the network,
+# and anything that isn't cached yet is fetched in the background.
+timeBudget = float(os.getenv("timeBudget", "2.0"))
 coverArtSize = 64
 defaultCoverArtUrl = "http://g-ecx.images-amazon.com/images/G/01/Audible/en_US/images/generic/no_image_s_150_image.jpg"
+# Cover art for a page is downloaded concurrently, at most
+# maxCoverArtWorkers images at a time. Results are rendered once every
+# download has finished or the latency budget (in seconds) has run out,
+# whichever comes first. The latency budget is capped at what is left of
+# timeBudget, so keep it below that.
+maxCoverArtWorkers = 5
+coverArtBudget = float(os.getenv("coverArtBudget", "1.0"))
+# Downloaded cover art is kept between searches in a store keyed by a
+# hash of the image URL. When the store grows past coverArtCacheMB the
+# least recently used images are evicted by the cache manager.
+coverArtCacheBytes = int(os.getenv("coverArtCacheMB", "50")) * 1024 * 1024
+# Image URLs that returned 404/410 are remembered for missingCoverArtTTL
+# seconds so they never hit the network on the hot path.
+missingCoverArtName = "coverart_missing"
+missingCoverArtTTL = 86400
+missingCoverArt = None
+# The "no image" placeholder is fetched once into the data directory,
+# outside of the cover art store, and kept for good.
+placeholderName = "no_image.jpg"
+# Catalog responses are cached for searchCacheTTL seconds, keyed by the
+# normalised request. At most searchCacheMaxEntries responses are kept;
+# the least recently used are dropped first.
+searchCacheTTL = int(os.getenv("searchCacheTTL", "3600"))
+searchCacheMaxEntries = int(os.getenv("searchCacheMaxEntries", "100"))
+# Each cached response is saved as a page file of just the fields we
+# render, stored column by column so a page can be memory-mapped and
+# each field decoded only when it is shown. Layout: header (magic,
+# version, product count, total results), then the offset of each
+# column. A text column is count+1 offsets into the UTF-8 bytes that
+# follow it; the runtime column is count signed ints (-1 if missing).
+pageMagic = "ASP1"
+pageVersion = 1
+pageHeader = struct.Struct(">4sHII")
+pageTextFields = ("asin", "title", "authors", "narrators", "format_type", "image")
+pageOffsets = struct.Struct(">%dI" % (len(pageTextFields) + 1))
+# Auto-complete suggestions are kept in a prefix trie of past completions.
+# Each completion and each queried prefix remembers when it was fetched
+# and is trusted for suggestionCacheTTL seconds.
+suggestionCacheTTL = int(os.getenv("suggestionCacheTTL", "86400"))
+suggestionTrieName = "suggestion_trie"
+# The suggestion trie and the table of missing cover art live in one
+# SQLite file in the cache directory. Either is evicted from it once it
+# hasn't been saved for its TTL (i.e. the workflow hasn't been used in
+# that time). Search results are kept as memory-mapped page files and
+# cover art as image files, both indexed by the cache manager.
+cacheStoreName = "cache.sqlite"
+# Argument, PID and refresh attempt files of background tasks that were
+# left behind (e.g. by a killed task) are deleted after backgroundFileTTL
+# seconds.
+backgroundFileTTL = 3600
+# When the prefetchNextPage workflow variable is "1", the next page of
+# results and its cover art are fetched into the cache in the background
+# as soon as a page has been shown.
+prefetchEnabled = os.getenv("prefetchNextPage") == "1"
+completionDecoder = json.JSONDecoder()
+skipWhitespace = re.compile(r"\s*").match
+
+class FetchError(Exception):
+	# Carries the title and subtitle of the error item to show
+	pass
+
+class FetchTimeout(FetchError):
+	# The request ran out of time rather than failing
+	pass
+
+def timedOut(err):
+	if isinstance(err, urllib2.URLError):
+		err = err.reason
+	return isinstance(err, socket.timeout) or (wf.deadline is not None and wf.deadline.expired)
 
 def addErrorItem(title, subtitle=""):
 	wf.add_item(
@@ -20,6 +97,16 @@ def addErrorItem(title, subtitle=""):
 		icon=ICON_ERROR
 	)
 
+def addSearchingItem(title):
+	# Shown while a background job fetches what didn't arrive in time.
+	# Workflow3.revalidate() has Alfred run the Script Filter again.
+	wf.add_item(
+		title=title,
+		subtitle="This is taking a while on your connection.",
+		valid=False,
+		icon=ICON_SYNC
+	)
+
 def displayVersion(productVersion):
 	return {
 		"abridged": "Abridged",
@@ -40,82 +127,235 @@ def displayTime(seconds, granularity=2):
 			result.append("{} {}".format(value, name))
 	return ' and '.join(result[:granularity])
 
-def cacheCoverArt(imageUrl):
-	imgName = os.path.basename(imageUrl)
-	basePath = imageUrl.replace(imgName, "")
-	pathToImg = coverArtDir + imgName
-	
+def coverArtPath(imageUrl):
+	ext = os.path.splitext(os.path.basename(imageUrl))[1]
+	return coverArtDir + hashlib.sha1(imageUrl.encode("utf-8")).hexdigest() + ext
+
+def loadMissingCoverArt():
+	# Maps image URL -> time it was found to be missing
+	global missingCoverArt
+	if missingCoverArt is None:
+		missingCoverArt = wf.cached_data(missingCoverArtName, max_age=0) or {}
+		if not os.path.isdir(coverArtDir):
+			os.makedirs(coverArtDir)
+	return missingCoverArt
+
+def saveMissingCoverArt():
+	if missingCoverArt is None:
+		return
+
+	now = time.time()
+	for imageUrl in list(missingCoverArt):
+		if now - missingCoverArt[imageUrl] > missingCoverArtTTL:
+			del missingCoverArt[imageUrl]
+	wf.cache_data(missingCoverArtName, missingCoverArt, ttl=missingCoverArtTTL)
+
+def isMissingCoverArt(imageUrl):
+	loadMissingCoverArt()
+	missingSince = missingCoverArt.get(imageUrl)
+	return missingSince is not None and time.time() - missingSince < missingCoverArtTTL
+
+def cachePlaceholder():
+	pathToImg = wf.datafile(placeholderName)
+
 	if os.path.isfile(pathToImg) == False:
-		img = open(pathToImg, "wb")
-		img.write(web.get(imageUrl, stream=True).content)
-		img.close()
+		try:
+			response = web.get(defaultCoverArtUrl)
+			response.raise_for_status()
+			img = open(pathToImg + ".part", "wb")
+			img.write(response.content)
+			img.close()
+			os.rename(pathToImg + ".part", pathToImg)
+		except Exception as err:
+			wf.logger.error("Failed to cache placeholder cover art: %s", err)
+			return "icon.png"
 
 	return pathToImg
 
-def parseSearchResults(results):
-	if "products" in results:
-		# Clear out any previously stored cover art
-		shutil.rmtree(coverArtDir, True)
-		os.mkdir(coverArtDir)
+def storeCoverArt(imageUrl, response):
+	if response.status_code in (404, 410):
+		missingCoverArt[imageUrl] = time.time()
+		return None
+	response.raise_for_status()
+
+	# Write to a temporary file first so an unfinished write
+	# never shows up as a (broken) cached image
+	pathToImg = coverArtPath(imageUrl)
+	content = response.content
+	img = open(pathToImg + ".part", "wb")
+	img.write(content)
+	img.close()
+	os.rename(pathToImg + ".part", pathToImg)
+	wf.cache_manager.record(pathToImg, len(content))
 
-		# Parse total result count
-		if "total_results" in results:
-			totalResultCount = results["total_results"]
+	return pathToImg
+
+def cacheCoverArts(imageUrls):
+	# Download every image that isn't cached yet in one concurrent batch
+	# and wait until they have all finished or coverArtBudget runs out.
+	# Returns a dict mapping each successfully cached URL to its path.
+	loadMissingCoverArt()
+	cachedImages = {}
+	downloads = []
+	for imageUrl in set(imageUrls):
+		pathToImg = coverArtPath(imageUrl)
+		if os.path.isfile(pathToImg):
+			wf.cache_manager.hit(pathToImg)
+			cachedImages[imageUrl] = pathToImg
+		elif not isMissingCoverArt(imageUrl):
+			wf.cache_manager.miss(pathToImg)
+			downloads.append(imageUrl)
+
+	responses = web.get_many(downloads, deadline=coverArtBudget, max_workers=maxCoverArtWorkers)
+
+	for imageUrl, response in zip(downloads, responses):
+		if response is None:
+			wf.logger.debug("No cover art for %s within budget, using default art.", imageUrl)
+			continue
+		try:
+			pathToImg = storeCoverArt(imageUrl, response)
+			if pathToImg is not None:
+				cachedImages[imageUrl] = pathToImg
+		except Exception as err:
+			wf.logger.error("Failed to cache cover art %s: %s", imageUrl, err)
+
+	return cachedImages
+
+def pageRecords(results):
+	# Reduces a catalog response to the fields we render, one tuple of
+	# pageTextFields (and the runtime) per product
+	records = []
+	for result in results["products"]:
+		titleComponents = []
+		if ("title" in result and len(result["title"])):
+			titleComponents.append(result["title"])
+			if ("subtitle" in result and len(result["subtitle"])):
+				titleComponents.append(result["subtitle"])
+
+		coverArtUrl = result.get("product_images", {}).get(str(coverArtSize))
+		runtime = result.get("runtime_length_min")
+		if runtime is None:
+			runtime = -1
+
+		records.append((
+			result.get("asin") or "",
+			": ".join(titleComponents),
+			", ".join(author["name"] for author in result.get("authors") or []),
+			", ".join(narrator["name"] for narrator in result.get("narrators") or []),
+			result.get("format_type") or "",
+			coverArtUrl or "",
+			runtime
+		))
+	return records
+
+def writeProductPage(pathToPage, results):
+	records = pageRecords(results)
+	columns = []
+	for field in range(len(pageTextFields)):
+		values = [record[field].encode("utf-8") for record in records]
+		offsets = [0]
+		for value in values:
+			offsets.append(offsets[-1] + len(value))
+		columns.append(struct.pack(">%dI" % len(offsets), *offsets) + "".join(values))
+	columns.append(struct.pack(">%di" % len(records), *[record[-1] for record in records]))
+
+	header = pageHeader.pack(pageMagic, pageVersion, len(records), results.get("total_results", 0))
+	offset = pageHeader.size + pageOffsets.size
+	columnOffsets = []
+	for column in columns:
+		columnOffsets.append(offset)
+		offset += len(column)
+
+	page = open(pathToPage + ".part", "wb")
+	page.write(header + pageOffsets.pack(*columnOffsets) + "".join(columns))
+	page.close()
+	os.rename(pathToPage + ".part", pathToPage)
+
+class ProductPage(object):
+	# Read-only view of a page file. Fields are decoded on access:
+	# page.text("title", 3), page.runtime(3) or page.column("image")
+
+	def __init__(self, pathToPage):
+		pageFile = open(pathToPage, "rb")
+		try:
+			self.data = mmap.mmap(pageFile.fileno(), 0, access=mmap.ACCESS_READ)
+		finally:
+			pageFile.close()
+
+		magic, version, self.count, self.totalResults = pageHeader.unpack_from(self.data)
+		if magic != pageMagic or version != pageVersion:
+			raise ValueError("Not a product page: " + pathToPage)
+		self.columns = pageOffsets.unpack_from(self.data, pageHeader.size)
+
+	def __len__(self):
+		return self.count
+
+	def text(self, field, index):
+		start = self.columns[pageTextFields.index(field)]
+		valueStart, valueEnd = struct.unpack_from(">2I", self.data, start + 4 * index)
+		start += 4 * (self.count + 1)
+		return self.data[start + valueStart:start + valueEnd].decode("utf-8")
+
+	def runtime(self, index):
+		runtime = struct.unpack_from(">i", self.data, self.columns[-1] + 4 * index)[0]
+		if runtime < 0:
+			return None
+		return runtime
+
+	def column(self, field):
+		return [self.text(field, index) for index in range(self.count)]
+
+def parseSearchResults(page):
+	if len(page):
+		totalResultCount = page.totalResults
+
+		# Download cover art for the whole page up front
+		coverArtUrls = page.column("image")
+		cachedImages = cacheCoverArts([url for url in coverArtUrls if len(url)])
+		defaultCoverArt = cachePlaceholder()
 
 		# Parse each result
-		for result in results["products"]:
+		for index in range(len(page)):
 			product = {}
 
 			# Parse asin
-			if ("asin" in result and len(result["asin"])):
-				product["asin"] = result["asin"]
+			asin = page.text("asin", index)
+			if len(asin):
+				product["asin"] = asin
 			else:
 				wf.logger.error("Failed to process asin.")
 
 			# Parse title
-			if ("title" in result and len(result["title"])):
-				titleComponents = [result["title"]]
-				if ("subtitle" in result and len(result["subtitle"])):
-					titleComponents.append(result["subtitle"])
-				product["title"] = ": ".join(titleComponents)
-
-			# Cache cover art
-			if "product_images" in result:
-				coverArtUrl = result["product_images"][str(coverArtSize)]
-				if (coverArtUrl is not None and len(coverArtUrl)):
-					product["icon"] = cacheCoverArt(coverArtUrl)
-				else:
-					product["icon"] = cacheCoverArt(defaultCoverArtUrl)
-			else:
-				product["icon"] = cacheCoverArt(defaultCoverArtUrl)
+			product["title"] = page.text("title", index)
+
+			# Cached cover art
+			product["icon"] = cachedImages.get(coverArtUrls[index], defaultCoverArt)
 
 			# Parse authors
-			authors = []
-			if ("authors" in result and len(result["authors"])):
-				for author in result["authors"]:
-					authors.append(author["name"])
-				product["authors"] = "By: " + ", ".join(authors)
+			authors = page.text("authors", index)
+			if len(authors):
+				product["authors"] = "By: " + authors
 			else:
 				wf.logger.error("Failed to process authors.")
 
 			# Parse narrators
-			narrators = []
-			if ("narrators" in result and len(result["narrators"])):
-				for narrator in result["narrators"]:
-					narrators.append(narrator["name"])
-				product["narrators"] = "Narrated By: " + ", ".join(narrators)
+			narrators = page.text("narrators", index)
+			if len(narrators):
+				product["narrators"] = "Narrated By: " + narrators
 			else:
 				wf.logger.error("Failed to process narrators.")
 
 			# Parse version
-			if ("format_type" in result and len(result["format_type"])):
-				product["version"] = result["format_type"]
+			version = page.text("format_type", index)
+			if len(version):
+				product["version"] = version
 			else:
 				wf.logger.error("Failed to process product type.")
 
 			# Parse length
-			if "runtime_length_min" in result:
-				product["length"] = result["runtime_length_min"]
+			length = page.runtime(index)
+			if length is not None:
+				product["length"] = length
 			else:
 				wf.logger.error("Failed to process running time.")
 
@@ -175,7 +415,46 @@ def parseSearchResults(results):
 		addErrorItem("No results found.")
 		return None
 
-def loadSearchResults(query):
+def searchCacheName(requestParams):
+	normalizedKey = json.dumps([
+		" ".join(requestParams["keywords"].lower().split()),
+		requestParams["page"],
+		requestParams["num_results"],
+		requestParams["products_sort_by"],
+		requestParams["language"],
+		requestParams["image_sizes"],
+		requestParams["response_groups"]
+	])
+	return "search_" + hashlib.sha1(normalizedKey.encode("utf-8")).hexdigest()
+
+def loadProductPage(pathToPage):
+	# Returns the page and its age in seconds, or (None, None) if there is
+	# no usable page file
+	try:
+		age = time.time() - os.path.getmtime(pathToPage)
+		return ProductPage(pathToPage), age
+	except (EnvironmentError, ValueError, struct.error):
+		return None, None
+
+def fetchSearchResults(requestParams):
+	try:
+		results = web.get("https://api.audible.com/1.0/catalog/products", requestParams)
+	except Exception as err:
+		if timedOut(err):
+			raise FetchTimeout("Failed to retrieve search results.", "Please try again later.")
+		raise FetchError("Failed to retrieve search results.", "Please try again later.")
+	else:
+		if results.status_code is not 200:
+			raise FetchError("Failed to retrieve search results.", "Please try again later.")
+		else:
+			try:
+				return results.json()
+			except Exception as err:
+				if timedOut(err):
+					raise FetchTimeout("Failed to retrieve search results.", "Please try again later.")
+				raise FetchError("Failed to parse search results.", "If this error continues please reach out.")
+
+def loadSearchResults(query, page=None, revalidate=True):
 	requestParams = {
 		"keywords": query,
 		"num_results": numResultsPerPage,
@@ -183,26 +462,132 @@ def loadSearchResults(query):
 		"products_sort_by": "Relevance",
 		"image_sizes": coverArtSize,
 		"response_groups": "media,product_desc,contributors,product_attrs",
-		"page": os.getenv("currentPage")
+		"page": page or os.getenv("currentPage")
 	}
+	cacheName = searchCacheName(requestParams)
+	pathToPage = pageDir + cacheName + ".page"
+
+	# Show expired responses straight away and refresh them in the background
+	refreshCommand = None
+	if revalidate:
+		refreshCommand = [
+			sys.executable,
+			wf.workflowfile("audiSearch.py"),
+			"--prefetch",
+			query.encode("utf-8"),
+			str(requestParams["page"])
+		]
+
+	page, age = loadProductPage(pathToPage)
+	if page is not None and (age < searchCacheTTL or refreshCommand is not None):
+		if age >= searchCacheTTL:
+			wf.revalidate(cacheName, refreshCommand)
+		wf.cache_manager.hit(pathToPage)
+		return page
+	wf.cache_manager.miss(pathToPage)
 
 	try:
-		results = web.get("https://api.audible.com/1.0/catalog/products", requestParams)
-	except:
-		addErrorItem("Failed to retrieve search results.", "Please try again later.")
-		return None
-	else:
-		if results.status_code is not 200:
-			addErrorItem("Failed to retrieve search results.", "Please try again later.")
-			return None
+		results = fetchSearchResults(requestParams)
+	except FetchError as err:
+		# Out of time or offline: an expired copy beats an error
+		if page is not None:
+			wf.logger.debug("Showing expired search results: %s", err.args[0])
+		elif (isinstance(err, FetchTimeout) and refreshCommand is not None
+				and wf.revalidate(cacheName, refreshCommand)):
+			# Too slow for the budget: fetch into the cache in the background
+			addSearchingItem("Searching...")
 		else:
-			try:
-				return results.json()
-			except:
-				addErrorItem("Failed to parse search results.", "If this error continues please reach out.")
+			addErrorItem(*err.args)
+		return page
+
+	if "products" not in results:
+		results = {"products": []}
+	if not os.path.isdir(pageDir):
+		os.makedirs(pageDir)
+	writeProductPage(pathToPage, results)
+	wf.cache_manager.record(pathToPage)
+
+	return ProductPage(pathToPage)
+
+def trieNode(trie, prefix, create=False):
+	# Nodes are dicts: "c" maps a character to a child node, "f"/"l" are
+	# when the node's prefix was last fetched and the completions that came
+	# back, "w"/"r"/"t" are the completion ending at this node, its rank in
+	# the last response and when it was seen
+	node = trie
+	for char in prefix:
+		if char not in node["c"]:
+			if not create:
 				return None
+			node["c"][char] = {"c": {}}
+		node = node["c"][char]
+	return node
+
+def trieCandidates(trie, prefix, maxAge=suggestionCacheTTL):
+	# Returns completions under `prefix` younger than `maxAge`, or None if
+	# no such response for `prefix` or one of its own prefixes is on record
+	now = time.time()
+	node = trie
+	fresh = now - node.get("f", 0) < maxAge
+	for char in prefix:
+		node = node["c"].get(char)
+		if node is None:
+			return [] if fresh else None
+		fresh = fresh or now - node.get("f", 0) < maxAge
+	if not fresh:
+		return None
 
-def loadSuggestions(query):
+	candidates = []
+	stack = [node]
+	while stack:
+		node = stack.pop()
+		if "w" in node and now - node["t"] < maxAge:
+			candidates.append((node["r"], node["w"]))
+		stack.extend(node["c"].values())
+	return [completion for rank, completion in sorted(candidates)]
+
+def trieInsert(trie, prefix, completions):
+	now = time.time()
+	trieNode(trie, prefix, create=True).update({"f": now, "l": completions})
+	for rank, completion in enumerate(completions):
+		node = trieNode(trie, completion.lower(), create=True)
+		node.update({"w": completion, "r": rank, "t": now})
+
+def triePrune(node, now):
+	# Drop expired completions and fetch marks, then empty branches.
+	# Returns True if `node` itself can be removed.
+	if now - node.get("f", now) >= suggestionCacheTTL:
+		del node["f"]
+		node.pop("l", None)
+	if "w" in node and now - node["t"] >= suggestionCacheTTL:
+		for key in ("w", "r", "t"):
+			del node[key]
+	for char in list(node["c"]):
+		if triePrune(node["c"][char], now):
+			del node["c"][char]
+	return not node["c"] and "f" not in node and "w" not in node
+
+def parseCompletionResponse(body):
+	# The body looks like
+	#   completion = ["query",["suggestion", ...],[{...}],[]];updateACCompletion();
+	# Only the echoed query and the suggestion list are decoded; the
+	# metadata that follows is never parsed.
+	pos = body.find("[")
+	if pos == -1:
+		raise ValueError("No completion array in response")
+
+	query, pos = completionDecoder.raw_decode(body, skipWhitespace(body, pos + 1).end())
+	pos = skipWhitespace(body, pos).end()
+	if body[pos:pos + 1] != ",":
+		raise ValueError("No suggestion list in response")
+
+	suggestions, pos = completionDecoder.raw_decode(body, skipWhitespace(body, pos + 1).end())
+	if not isinstance(suggestions, list):
+		raise ValueError("No suggestion list in response")
+
+	return suggestions
+
+def fetchSuggestions(query):
 	requestParams = {
 		"method": "completion",
 		"q": query,
@@ -215,24 +600,75 @@ def loadSuggestions(query):
 
 	try:
 		suggestions = web.get("https://completion.amazon.com/search/complete", requestParams)
-	except:
-		addErrorItem("Failed to retrieve auto-complete suggestions.", "Please try again later.")
-		return None
+	except Exception as err:
+		if timedOut(err):
+			raise FetchTimeout("Failed to retrieve auto-complete suggestions.", "Please try again later.")
+		raise FetchError("Failed to retrieve auto-complete suggestions.", "Please try again later.")
 	else:
 		if suggestions.status_code is not 200:
-			addErrorItem("Failed to retrieve auto-complete suggestions.", "Please try again later.")
-			return None
-		elif len(suggestions.text):
-			suggestions = suggestions.text.replace("completion = ", "")
-			suggestions = suggestions.replace(";updateACCompletion();", "")
-			suggestions = ast.literal_eval(suggestions)
+			raise FetchError("Failed to retrieve auto-complete suggestions.", "Please try again later.")
+		else:
+			try:
+				body = suggestions.text
+			except Exception as err:
+				if timedOut(err):
+					raise FetchTimeout("Failed to retrieve auto-complete suggestions.", "Please try again later.")
+				raise FetchError("Failed to retrieve auto-complete suggestions.", "Please try again later.")
+			if not len(body):
+				return None
+			try:
+				return parseCompletionResponse(body)
+			except ValueError as err:
+				wf.logger.error("Failed to parse auto-complete suggestions: %s", err)
+				return None
 
+def suggestionCacheName(prefix):
+	return "suggest_" + hashlib.sha1(prefix.encode("utf-8")).hexdigest()
+
+def loadSuggestions(query, revalidate=True):
+	prefix = query.lower()
+	trie = wf.cached_data(suggestionTrieName, max_age=0) or {"c": {}}
+
+	# A response for this exact prefix is used as is: it may hold
+	# completions (e.g. spelling corrections) that don't start with it.
+	# Otherwise filter completions we already know about locally.
+	node = trieNode(trie, prefix)
+	if node is not None and time.time() - node.get("f", 0) < suggestionCacheTTL:
+		return node.get("l") or trieCandidates(trie, prefix) or []
+	candidates = trieCandidates(trie, prefix)
+	if candidates:
+		return candidates
+
+	try:
+		suggestions = fetchSuggestions(query)
+	except FetchError as err:
+		# Out of time or offline: fall back to expired completions
+		suggestions = (node is not None and node.get("l")) or trieCandidates(trie, prefix, maxAge=float("inf"))
+		if suggestions:
 			return suggestions
+		refreshCommand = [
+			sys.executable,
+			wf.workflowfile("audiSearch.py"),
+			"--suggest",
+			query.encode("utf-8")
+		]
+		if (isinstance(err, FetchTimeout) and revalidate
+				and wf.revalidate(suggestionCacheName(prefix), refreshCommand)):
+			# Too slow for the budget: fetch into the trie in the background
+			addSearchingItem("Loading suggestions...")
 		else:
-			return None 
+			addErrorItem(*err.args)
+		return suggestions
+
+	if suggestions is not None:
+		trieInsert(trie, prefix, suggestions)
+		triePrune(trie, time.time())
+		wf.cache_data(suggestionTrieName, trie, ttl=suggestionCacheTTL)
+
+	return suggestions
 
 def parseSuggestions(suggestions):
-	for suggestion in suggestions[1]:
+	for suggestion in suggestions:
 		wf.add_item(
 			title=suggestion,
 			arg=suggestion,
@@ -240,6 +676,44 @@ def parseSuggestions(suggestions):
 			icon="blank.png"
 		)
 
+def prefetchNextPage(query, page):
+	if not prefetchEnabled or not len(page):
+		return
+
+	nextPage = int(os.getenv("currentPage")) + 1
+	if (nextPage * numResultsPerPage) < page.totalResults:
+		run_in_background("prefetch", [
+			sys.executable,
+			wf.workflowfile("audiSearch.py"),
+			"--prefetch",
+			query.encode("utf-8"),
+			str(nextPage)
+		])
+
+def prefetch(wf):
+	# Runs in the background: warm the caches for one page of results
+	query, page = wf.args[1], wf.args[2]
+	results = loadSearchResults(query, page, revalidate=False)
+
+	if (results is not None and len(results)):
+		cacheCoverArts([url for url in results.column("image") if len(url)])
+		cachePlaceholder()
+		saveMissingCoverArt()
+
+	# Pick up files the index doesn't know about, such as those of
+	# background tasks, while nobody is waiting on us
+	wf.cache_manager.scan()
+
+def prefetchSuggestions(wf):
+	# Runs in the background: fetch suggestions that didn't arrive within
+	# the Script Filter's budget into the trie
+	loadSuggestions(wf.args[1], revalidate=False)
+
+def scanCache(wf):
+	# Runs in the background: (re)build the cache index from the files
+	# on disk. Eviction and saving happen at the end of wf.run()
+	wf.cache_manager.scan()
+
 def main(wf):
 	if len(wf.args):
 		query = wf.args[0]
@@ -252,9 +726,10 @@ def main(wf):
 
 			if results is not None:
 				parseSearchResults(results)
+				prefetchNextPage(query, results)
 		else:
-			suggestions = loadSuggestions(query)
-
+			# The query itself always comes first, so Enter searches for it
+			# even while suggestions are loading
 			wf.add_item(
 				title=query,
 				arg=query,
@@ -262,14 +737,40 @@ def main(wf):
 				icon="blank.png"
 			)
 
-			if (suggestions is not None and len(suggestions[1])):
+			suggestions = loadSuggestions(query)
+			if (suggestions is not None and len(suggestions)):
 				parseSuggestions(suggestions)
 
 	wf.send_feedback()
+	saveMissingCoverArt()
+
+	# A new (or unreadable) cache index only knows the files used since.
+	# Walk the cache directory for the others in the background.
+	if wf.cache_manager.needs_scan:
+		run_in_background("scan", [
+			sys.executable,
+			wf.workflowfile("audiSearch.py"),
+			"--scan"
+		])
 
 if __name__ == u"__main__":
 	wf = Workflow3(update_settings={"github_slug": "snewman205/audisearch-for-alfred"})
+	wf.cache_store = SQLiteStore(wf.cachefile(cacheStoreName))
 	coverArtDir = wf.cachedir + "/coverart/"
+	pageDir = wf.cachedir + "/pages/"
+	wf.cache_manager = CacheManager(wf.cachedir, [
+		Namespace("coverart", "coverart/*", max_bytes=coverArtCacheBytes),
+		Namespace("pages", "pages/*.page", max_entries=searchCacheMaxEntries),
+		Namespace("background", ("*.argcache", "*.pid", "*.attempt"),
+			ttl=backgroundFileTTL)
+	])
+	if (len(sys.argv) > 1 and sys.argv[1] == "--prefetch"):
+		sys.exit(wf.run(prefetch))
+	if (len(sys.argv) > 1 and sys.argv[1] == "--suggest"):
+		sys.exit(wf.run(prefetchSuggestions))
+	if (len(sys.argv) > 1 and sys.argv[1] == "--scan"):
+		sys.exit(wf.run(scanCache))
+
 	if wf.update_available:
 		wf.add_item(
 			title="New version available",
@@ -278,4 +779,4 @@ if __name__ == u"__main__":
 			icon=ICON_INFO
 		)
 
-	sys.exit(wf.run(main))
\ No newline at end of file
+	sys.exit(wf.run(main, budget=timeBudget))
\ No newline at end of file
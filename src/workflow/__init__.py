@@ -13,7 +13,7 @@
 import os
 
 # Workflow objects
-from .workflow import Workflow, manager
+from .workflow import Workflow, manager, FilterIndex
 from .workflow3 import Workflow3
 
 # Exceptions
@@ -70,6 +70,7 @@ __all__ = [
     'Workflow',
     'Workflow3',
     'manager',
+    'FilterIndex',
     'PasswordNotFound',
     'KeychainError',
     'ICON_ACCOUNT',
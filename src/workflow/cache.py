@@ -0,0 +1,473 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""Size accounting and eviction for files in a workflow's cache directory.
+
+A :class:`CacheManager` divides :attr:`~workflow.workflow.Workflow.cachedir`
+into :class:`Namespace` objects, each with its own byte and entry quotas,
+TTL and eviction policy. It keeps an index of managed files with their
+sizes, last access times and hit counts, so quotas can be enforced
+without walking the directory. Assign one to
+:attr:`Workflow.cache_manager <workflow.workflow.Workflow.cache_manager>`
+and :meth:`~workflow.workflow.Workflow.cached_data` and
+:meth:`~workflow.workflow.Workflow.cache_data` report to it. Each
+:meth:`~workflow.workflow.Workflow.run` ends with a bounded round of
+eviction.
+
+Files created by other code (downloads, background task files etc.)
+are reported with :meth:`CacheManager.record` and :meth:`CacheManager.hit`,
+or picked up by :meth:`CacheManager.scan`, which should be called from
+a background process. A missing or unreadable index is started afresh,
+and :attr:`CacheManager.needs_scan` tells when it needs such a scan to
+pick up existing files.
+
+"""
+
+from __future__ import print_function, unicode_literals
+
+import cPickle
+import errno
+import fnmatch
+import heapq
+import os
+import time
+
+from workflow import LockFile, atomic_writer
+
+__all__ = ['CacheManager', 'Namespace']
+
+#: Default maximum number of files deleted by one :meth:`CacheManager.evict`
+EVICT_BATCH = 20
+
+#: Number of index entries checked for expiry by one
+#: :meth:`CacheManager.evict`
+SWEEP_BATCH = 50
+
+# Eviction policies: sort key of an entry ``[namespace, size, atime, hits]``.
+# Entries with the smallest keys are evicted first.
+POLICIES = {
+    'lru': lambda entry: entry[2],
+    'lfu': lambda entry: (entry[3], entry[2]),
+}
+
+
+class Namespace(object):
+    """Group of cache files with a common quota and eviction policy.
+
+    :param name: name of namespace, used in :meth:`CacheManager.stats`
+    :type name: ``unicode``
+    :param patterns: :mod:`fnmatch` pattern(s) matched against paths
+        relative to the cache directory, e.g. ``'thumbs/*'`` or
+        ``('*.pid', '*.argcache')``
+    :type patterns: ``unicode`` or ``tuple``
+    :param max_bytes: maximum combined size of files
+    :type max_bytes: ``int``
+    :param max_entries: maximum number of files
+    :type max_entries: ``int``
+    :param ttl: seconds since last access after which files are deleted
+    :type ttl: ``int``
+    :param policy: ``'lru'`` (least recently used) or ``'lfu'`` (least
+        frequently used) files are evicted first to fit the quotas
+
+    """
+
+    def __init__(self, name, patterns, max_bytes=None, max_entries=None,
+                 ttl=None, policy='lru'):
+        """Create new :class:`Namespace` object."""
+        if policy not in POLICIES:
+            raise ValueError('Unknown eviction policy : {0!r}'.format(policy))
+
+        if isinstance(patterns, basestring):
+            patterns = (patterns,)
+
+        self.name = name
+        self.patterns = tuple(patterns)
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.policy = policy
+
+    def match(self, relpath):
+        """Return ``True`` if ``relpath`` belongs to this namespace."""
+        for pattern in self.patterns:
+            if fnmatch.fnmatch(relpath, pattern):
+                return True
+        return False
+
+
+class CacheManager(object):
+    """Enforce quotas and TTLs on files in a cache directory.
+
+    The index is loaded on first use and written back by :meth:`save`,
+    merged with any changes another process has saved in the meantime.
+    If there is no index yet (or it can't be read), an empty one is
+    used until :meth:`scan` is called.
+
+    :param dirpath: the cache directory
+    :type dirpath: ``unicode``
+    :param namespaces: managed groups of files. A file belongs to the
+        first namespace that matches it. Files that match none are
+        left alone.
+    :type namespaces: ``list`` of :class:`Namespace`
+
+    """
+
+    def __init__(self, dirpath, namespaces):
+        """Create new :class:`CacheManager` object."""
+        self.dirpath = dirpath
+        self.namespaces = list(namespaces)
+        self.index_path = os.path.join(dirpath, '.cachemanager.cpickle')
+        # relpath -> [namespace, size, atime, hits]
+        self._entries = None
+        # Changes since the index was loaded. relpath -> time of change
+        self._changed = {}
+        self._removed = {}
+        # namespace -> {'hits': n, 'misses': n, 'evictions': n}
+        self._stats = {}
+        self._stats_delta = {}
+        self._cursor = 0
+        # Whether the index has been built with `scan()` and whether
+        # that is recorded on disk
+        self._scanned = False
+        self._scan_saved = False
+
+    @property
+    def entries(self):
+        """Index of managed files, loaded on first access."""
+        if self._entries is None:
+            index = self._load_index()
+            if index is None:
+                self._entries = {}
+            else:
+                self._entries = index['entries']
+                self._stats = index['stats']
+                self._cursor = index['cursor']
+                self._scanned = self._scan_saved = index['scanned']
+        return self._entries
+
+    @property
+    def needs_scan(self):
+        """``True`` if the index may be missing files already on disk.
+
+        That is, it was started afresh and :meth:`scan` hasn't been
+        called on it yet. Call :meth:`scan` from a background process.
+
+        """
+        self.entries
+        return not self._scanned
+
+    def namespace(self, path):
+        """Return :class:`Namespace` that ``path`` belongs to or ``None``."""
+        relpath = self._relpath(path)
+        for namespace in self.namespaces:
+            if namespace.match(relpath):
+                return namespace
+        return None
+
+    def record(self, path, size=None):
+        """Add or update file ``path`` after it has been written.
+
+        :param path: path of file
+        :param size: size of file in bytes. Read from disk if not given.
+
+        """
+        namespace = self.namespace(path)
+        if namespace is None:
+            return
+
+        if size is None:
+            size = os.path.getsize(path)
+
+        relpath = self._relpath(path)
+        now = time.time()
+        entry = self.entries.get(relpath)
+        hits = entry[3] if entry is not None else 0
+        self.entries[relpath] = [namespace.name, size, now, hits]
+        self._changed[relpath] = now
+        self._removed.pop(relpath, None)
+
+    def hit(self, path):
+        """Mark existing file ``path`` as used and count a cache hit."""
+        namespace = self.namespace(path)
+        if namespace is None:
+            return
+
+        relpath = self._relpath(path)
+        entry = self.entries.get(relpath)
+        if entry is None:
+            self.record(path)
+            entry = self.entries[relpath]
+
+        entry[2] = time.time()
+        entry[3] += 1
+        self._changed[relpath] = entry[2]
+        self._count(namespace.name, 'hits')
+
+    def miss(self, path):
+        """Count a cache miss for ``path``."""
+        namespace = self.namespace(path)
+        if namespace is not None:
+            self._count(namespace.name, 'misses')
+
+    def forget(self, path):
+        """Remove ``path`` from the index after it has been deleted."""
+        self._drop(self._relpath(path))
+
+    def evict(self, limit=EVICT_BATCH, deadline=None):
+        """Delete expired files and files over their namespace's quota.
+
+        Only a slice of the index is checked for expired files on each
+        call, and at most ``limit`` files are deleted, so calling this
+        on every run keeps the cache within bounds in small steps.
+
+        :param limit: maximum number of files to delete
+        :type limit: ``int``
+        :param deadline: stop early when this has expired
+        :type deadline: :class:`~workflow.web.Deadline`
+        :returns: number of files deleted
+        :rtype: ``int``
+
+        """
+        entries = self.entries
+        namespaces = dict((ns.name, ns) for ns in self.namespaces)
+        now = time.time()
+        evicted = 0
+
+        def out_of_time():
+            return deadline is not None and deadline.expired
+
+        # TTL sweep over the next slice of the index
+        relpaths = list(entries)
+        if self._cursor >= len(relpaths):
+            self._cursor = 0
+        batch = relpaths[self._cursor:self._cursor + SWEEP_BATCH]
+        self._cursor += len(batch)
+
+        for relpath in batch:
+            if evicted >= limit or out_of_time():
+                return evicted
+            entry = entries[relpath]
+            namespace = namespaces.get(entry[0])
+            if namespace is None:  # Namespace no longer configured
+                self._drop(relpath)
+            elif namespace.ttl and now - entry[2] > namespace.ttl:
+                self._evict(relpath)
+                evicted += 1
+
+        # Quotas
+        for namespace in self.namespaces:
+            if not (namespace.max_bytes or namespace.max_entries):
+                continue
+
+            members = [relpath for relpath in entries
+                       if entries[relpath][0] == namespace.name]
+            size = sum(entries[relpath][1] for relpath in members)
+            excess = 0
+            if namespace.max_entries:
+                excess = len(members) - namespace.max_entries
+
+            if excess <= 0 and not (namespace.max_bytes and
+                                    size > namespace.max_bytes):
+                continue
+
+            policy = POLICIES[namespace.policy]
+            victims = heapq.nsmallest(
+                limit - evicted, members,
+                key=lambda relpath: policy(entries[relpath]))
+            for relpath in victims:
+                if out_of_time():
+                    return evicted
+                size -= entries[relpath][1]
+                self._evict(relpath)
+                evicted += 1
+                excess -= 1
+                if excess <= 0 and not (namespace.max_bytes and
+                                        size > namespace.max_bytes):
+                    break
+
+            if evicted >= limit:
+                break
+
+        return evicted
+
+    def clear(self, namespace=None):
+        """Delete all files in ``namespace`` or in every namespace.
+
+        :param namespace: name of namespace
+        :type namespace: ``unicode``
+
+        """
+        for relpath in list(self.entries):
+            if namespace is None or self.entries[relpath][0] == namespace:
+                self._evict(relpath)
+
+    def reset(self):
+        """Discard the in-memory index, e.g. after the directory was wiped."""
+        self._entries = None
+        self._changed = {}
+        self._removed = {}
+        self._stats = {}
+        self._stats_delta = {}
+        self._cursor = 0
+        self._scanned = self._scan_saved = False
+
+    def scan(self):
+        """Walk the cache directory and bring the index up to date.
+
+        This reads every file's metadata, so call it from a background
+        process, not a Script Filter.
+
+        """
+        found = set()
+        for dirpath, dirnames, filenames in os.walk(self.dirpath):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                namespace = self.namespace(path)
+                if namespace is None:
+                    continue
+
+                relpath = self._relpath(path)
+                found.add(relpath)
+                if relpath in self.entries:
+                    continue
+
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+
+                self.entries[relpath] = [namespace.name, stat.st_size,
+                                         stat.st_mtime, 0]
+                self._changed[relpath] = stat.st_mtime
+
+        for relpath in list(self.entries):
+            if relpath not in found:
+                self._drop(relpath)
+
+        self._scanned = True
+
+    def stats(self):
+        """Return statistics for each namespace.
+
+        :returns: ``{namespace: {'hits': n, 'misses': n, 'evictions': n,
+            'bytes': n, 'entries': n}}``
+        :rtype: ``dict``
+
+        """
+        entries = self.entries
+        stats = {}
+        for namespace in self.namespaces:
+            counts = self._stats.get(namespace.name, {})
+            stats[namespace.name] = {
+                'hits': counts.get('hits', 0),
+                'misses': counts.get('misses', 0),
+                'evictions': counts.get('evictions', 0),
+                'bytes': 0,
+                'entries': 0,
+            }
+
+        for entry in entries.values():
+            if entry[0] in stats:
+                stats[entry[0]]['bytes'] += entry[1]
+                stats[entry[0]]['entries'] += 1
+
+        return stats
+
+    def save(self):
+        """Save the index, merged with the copy on disk."""
+        if self._entries is None:
+            return
+
+        if not (self._changed or self._removed or self._stats_delta or
+                self._scanned and not self._scan_saved):
+            return
+
+        with LockFile(self.index_path):
+            index = self._load_index() or {'entries': {}, 'stats': {},
+                                           'cursor': 0, 'scanned': False}
+            saved = index['entries']
+
+            for relpath, removed in self._removed.items():
+                entry = saved.get(relpath)
+                if entry is not None and entry[2] <= removed:
+                    del saved[relpath]
+
+            for relpath in self._changed:
+                entry = self._entries.get(relpath)
+                if entry is None:
+                    continue
+                other = saved.get(relpath)
+                if other is not None:
+                    entry[3] = max(entry[3], other[3])
+                    if other[2] > entry[2]:
+                        entry = other
+                saved[relpath] = entry
+
+            for name, counts in self._stats_delta.items():
+                totals = index['stats'].setdefault(name, {})
+                for key, count in counts.items():
+                    totals[key] = totals.get(key, 0) + count
+
+            index['cursor'] = self._cursor
+            index['scanned'] = index['scanned'] or self._scanned
+
+            with atomic_writer(self.index_path, 'wb') as file_obj:
+                cPickle.dump(index, file_obj, protocol=-1)
+
+        self._entries = saved
+        self._stats = index['stats']
+        self._scanned = self._scan_saved = index['scanned']
+        self._changed = {}
+        self._removed = {}
+        self._stats_delta = {}
+
+    def _load_index(self):
+        """Load index from disk or return ``None`` if there is none.
+
+        A truncated or otherwise corrupt index counts as none.
+
+        """
+        try:
+            with open(self.index_path, 'rb') as file_obj:
+                index = cPickle.load(file_obj)
+        except IOError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            return None
+        except Exception:  # unpickling errors are of many types
+            return None
+
+        if not isinstance(index, dict) or 'entries' not in index:
+            return None
+
+        index.setdefault('stats', {})
+        index.setdefault('cursor', 0)
+        index.setdefault('scanned', False)
+        return index
+
+    def _relpath(self, path):
+        """Return ``path`` relative to the cache directory."""
+        return os.path.relpath(path, self.dirpath)
+
+    def _count(self, name, key):
+        """Increment statistic ``key`` of namespace ``name``."""
+        for stats in (self._stats, self._stats_delta):
+            counts = stats.setdefault(name, {})
+            counts[key] = counts.get(key, 0) + 1
+
+    def _drop(self, relpath):
+        """Remove ``relpath`` from the index."""
+        self.entries.pop(relpath, None)
+        self._changed.pop(relpath, None)
+        self._removed[relpath] = time.time()
+
+    def _evict(self, relpath):
+        """Delete file ``relpath`` and remove it from the index."""
+        entry = self.entries[relpath]
+        try:
+            os.unlink(os.path.join(self.dirpath, relpath))
+        except OSError as err:
+            if err.errno != errno.ENOENT:
+                raise
+        self._drop(relpath)
+        self._count(entry[0], 'evictions')
@@ -311,7 +311,8 @@ def get_valid_releases(github_slug, prereleases=False):
     def retrieve_releases():
         wf().logger.info(
             'Retrieving releases for `%s` ...', github_slug)
-        return web.get(api_url).json()
+        cache = web.HTTPCache(wf().cachefile('http'))
+        return web.get(api_url, cache=cache).json()
 
     slug = github_slug.replace('/', '-')
     for release in wf().cached_data('gh-releases-{0}'.format(slug),
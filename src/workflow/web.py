@@ -7,25 +7,60 @@
 # Created on 2014-02-15
 #
 
-"""Lightweight HTTP library with a requests-like interface."""
+"""Lightweight HTTP library with a requests-like interface.
+
+Keep-alive connections are pooled in :data:`connection_pool`, which
+only lives as long as the process. A Script Filter runs in a new
+process for every keystroke, so connections are only re-used by
+requests to the same host within one run, e.g. a batch of cover art
+downloads made with :func:`get_many`, never from one run to the next.
+
+"""
 
 import codecs
+from cStringIO import StringIO
+from email.utils import mktime_tz, parsedate_tz
+import errno
+import hashlib
+import httplib
 import json
+import logging
+import mimetools
 import mimetypes
 import os
 import random
 import re
 import socket
 import string
+import threading
+import time
 import unicodedata
 import urllib
 import urllib2
 import urlparse
 import zlib
+from Queue import Queue, Empty
 
 
 USER_AGENT = u'Alfred-Workflow/1.19 (+http://www.deanishe.net/alfred-workflow)'
 
+# Same logger as `Workflow.logger`
+_log = logging.getLogger('workflow')
+
+#: Seconds an idle keep-alive connection is kept open for re-use
+POOL_IDLE_TIMEOUT = 30
+
+#: Maximum number of idle connections kept open per host
+POOL_MAX_SIZE = 4
+
+#: Default number of concurrent requests made by :func:`get_many`
+MAX_WORKERS = 5
+
+#: Methods sent over pooled connections. They are re-sent on a new
+#: connection if the server has closed the pooled one. Other requests
+#: always use a new connection, as they mustn't be sent twice
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE', 'PUT', 'DELETE')
+
 # Valid characters for multipart form data boundaries
 BOUNDARY_CHARS = string.digits + string.ascii_letters
 
@@ -74,6 +109,64 @@ RESPONSES = {
 }
 
 
+class DeadlineExceeded(socket.timeout):
+    """Raised when a request is made after the :class:`Deadline` expired."""
+
+
+class Deadline(object):
+    """Wall-clock time budget shared by several operations.
+
+    Install one with :func:`set_deadline` to cap the timeout of every
+    request made by this module at the time left in the budget. Once the
+    budget has been used up, requests raise :class:`DeadlineExceeded`
+    instead of touching the network.
+
+    :param seconds: length of the budget in seconds
+    :type seconds: ``float``
+
+    """
+
+    def __init__(self, seconds):
+        """Create new :class:`Deadline` ``seconds`` from now."""
+        self.seconds = seconds
+        self.expires = time.time() + seconds
+
+    def remaining(self):
+        """Seconds left in the budget (never negative)."""
+        return max(0, self.expires - time.time())
+
+    @property
+    def expired(self):
+        """``True`` if the budget has been used up."""
+        return time.time() >= self.expires
+
+    def timeout(self, timeout=None):
+        """Return ``timeout`` capped at the time left in the budget."""
+        if timeout is None:
+            return self.remaining()
+        return min(timeout, self.remaining())
+
+
+# Deadline installed with `set_deadline()`
+_deadline = None
+
+
+def set_deadline(deadline):
+    """Make all requests draw from ``deadline``.
+
+    :param deadline: the budget or ``None`` to remove it
+    :type deadline: :class:`Deadline`
+
+    """
+    global _deadline
+    _deadline = deadline
+
+
+def get_deadline():
+    """Return the :class:`Deadline` installed with :func:`set_deadline`."""
+    return _deadline
+
+
 def str_dict(dic):
     """Convert keys and values in ``dic`` into UTF-8-encoded :class:`str`.
 
@@ -101,6 +194,221 @@ class NoRedirectHandler(urllib2.HTTPRedirectHandler):
         return None
 
 
+class ConnectionPool(object):
+    """Idle keep-alive connections grouped by scheme and host.
+
+    Connections are handed out by :meth:`get` and returned by
+    :meth:`put` once their response has been read in full. Idle
+    connections older than ``idle_timeout`` seconds are closed instead
+    of being re-used, and at most ``max_size`` idle connections are
+    kept per host. Connections are never shared between processes.
+
+    :param max_size: maximum number of idle connections per host
+    :type max_size: ``int``
+    :param idle_timeout: seconds after which idle connections are closed
+    :type idle_timeout: ``int``
+
+    """
+
+    def __init__(self, max_size=POOL_MAX_SIZE,
+                 idle_timeout=POOL_IDLE_TIMEOUT):
+        """Create new :class:`ConnectionPool`."""
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return an idle connection for ``key`` or ``None``.
+
+        :param key: ``(scheme, host)`` tuple
+        :returns: :class:`httplib.HTTPConnection` or ``None``
+
+        """
+        now = time.time()
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                conn, released = idle.pop()
+                if now - released < self.idle_timeout:
+                    return conn
+                conn.close()
+        return None
+
+    def put(self, key, conn):
+        """Return ``conn`` to the pool, or close it if the pool is full.
+
+        :param key: ``(scheme, host)`` tuple
+        :param conn: :class:`httplib.HTTPConnection` whose last response
+            has been read in full
+
+        """
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_size:
+                idle.append((conn, time.time()))
+                return
+        conn.close()
+
+    def clear(self):
+        """Close all idle connections."""
+        with self._lock:
+            for idle in self._idle.values():
+                for conn, _ in idle:
+                    conn.close()
+            self._idle = {}
+
+
+#: Default pool used by :func:`request`
+connection_pool = ConnectionPool()
+
+
+class PooledResponse(object):
+    """Returns its connection to the pool once the body has been read.
+
+    Wraps an :class:`httplib.HTTPResponse`. ``recv`` is used by
+    :class:`socket._fileobject`, which provides the file-like interface
+    :mod:`urllib2` expects.
+
+    """
+
+    def __init__(self, pool, key, conn, response):
+        """Create new :class:`PooledResponse`."""
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._response = response
+
+    def recv(self, amt=None):
+        """Read up to ``amt`` bytes of the response body."""
+        data = self._response.read(amt)
+        if self._response.isclosed():
+            self._release()
+        return data
+
+    def close(self):
+        """Close response. Unread connections can't be re-used."""
+        self._response.close()
+        self._release()
+
+    def _release(self):
+        if self._conn is None:
+            return
+        if self._response.isclosed() and not self._response.will_close:
+            self._pool.put(self._key, self._conn)
+        else:
+            self._conn.close()
+        self._conn = None
+
+
+def idle_connection_closed(err):
+    """Return ``True`` if ``err`` means the server closed the connection.
+
+    I.e. a pooled connection was closed by the server while it was idle,
+    so the request failed before the server sent anything back. Timeouts
+    (including :class:`DeadlineExceeded`) don't count: the server may
+    be slow and may already have received the request.
+
+    """
+    if isinstance(err, httplib.BadStatusLine):
+        # Older versions of httplib pass the empty status line
+        line = err.line.strip("'")
+        return not line or line.startswith('No status line received')
+
+    if isinstance(err, socket.timeout):
+        return False
+
+    return (isinstance(err, socket.error) and
+            err.errno in (errno.ECONNRESET, errno.EPIPE))
+
+
+class KeepAliveHandler(urllib2.HTTPHandler, urllib2.HTTPSHandler):
+    """Make HTTP(S) requests over persistent connections from a pool.
+
+    Replaces :mod:`urllib2`'s default HTTP and HTTPS handlers, which
+    open a new connection (and do a new TLS handshake) for every
+    request.
+
+    :param pool: where to keep idle connections
+    :type pool: :class:`ConnectionPool`
+
+    """
+
+    def __init__(self, pool=None):
+        """Create new :class:`KeepAliveHandler`."""
+        urllib2.HTTPHandler.__init__(self)
+        urllib2.HTTPSHandler.__init__(self)
+        self.pool = pool or connection_pool
+
+    def http_open(self, req):
+        return self._open(httplib.HTTPConnection, req)
+
+    def https_open(self, req):
+        return self._open(httplib.HTTPSConnection, req,
+                          context=self._context)
+
+    def _open(self, http_class, req, **http_conn_args):
+        # Proxy tunnels are set up per connection, so leave them to urllib2
+        if req._tunnel_host:
+            return self.do_open(http_class, req, **http_conn_args)
+
+        host = req.get_host()
+        if not host:
+            raise urllib2.URLError('no host given')
+
+        key = (req.get_type(), host)
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update(dict((k, v) for k, v in req.headers.items()
+                            if k not in headers))
+        headers['Connection'] = 'keep-alive'
+        headers = dict(
+            (name.title(), val) for name, val in headers.items())
+
+        response = None
+        conn = None
+        if req.get_method() in IDEMPOTENT_METHODS:
+            conn = self.pool.get(key)
+        if conn is not None:
+            try:
+                response = self._send(conn, req, headers)
+            except (socket.error, httplib.HTTPException) as err:
+                conn.close()
+                if not idle_connection_closed(err):
+                    if isinstance(err, socket.error):
+                        raise urllib2.URLError(err)
+                    raise
+
+                # Server closed the idle connection. Try a new one.
+                conn = None
+
+        if conn is None:
+            conn = http_class(host, timeout=req.timeout, **http_conn_args)
+            try:
+                response = self._send(conn, req, headers)
+            except socket.error as err:
+                conn.close()
+                raise urllib2.URLError(err)
+
+        fp = socket._fileobject(
+            PooledResponse(self.pool, key, conn, response), close=True)
+
+        resp = urllib.addinfourl(fp, response.msg, req.get_full_url())
+        resp.code = response.status
+        resp.msg = response.reason
+        return resp
+
+    def _send(self, conn, req, headers):
+        timeout = req.timeout
+        if timeout is socket._GLOBAL_DEFAULT_TIMEOUT:
+            timeout = socket.getdefaulttimeout()
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        conn.request(req.get_method(), req.get_selector(), req.data, headers)
+        return conn.getresponse(buffering=True)
+
+
 # Adapted from https://gist.github.com/babakness/3901174
 class CaseInsensitiveDictionary(dict):
     """Dictionary with caseless key search.
@@ -186,12 +494,17 @@ class Response(object):
 
     """
 
-    def __init__(self, request, stream=False):
+    def __init__(self, request, stream=False, opener=None,
+                 timeout=socket._GLOBAL_DEFAULT_TIMEOUT):
         """Call `request` with :mod:`urllib2` and process results.
 
         :param request: :class:`urllib2.Request` instance
         :param stream: Whether to stream response or retrieve it all at once
         :type stream: ``bool``
+        :param opener: :class:`urllib2.OpenerDirector` to open ``request``
+            with. Default is :mod:`urllib2`'s installed opener.
+        :param timeout: socket timeout in seconds
+        :type timeout: ``float``
 
         """
         self.request = request
@@ -206,10 +519,15 @@ class Response(object):
         self._content = None
         self._content_loaded = False
         self._gzipped = False
+        #: ``True`` if the response was loaded from an :class:`HTTPCache`
+        self.from_cache = False
 
         # Execute query
         try:
-            self.raw = urllib2.urlopen(request)
+            if opener is not None:
+                self.raw = opener.open(request, timeout=timeout)
+            else:
+                self.raw = urllib2.urlopen(request, timeout=timeout)
         except urllib2.HTTPError as err:
             self.error = err
             try:
@@ -452,9 +770,224 @@ class Response(object):
         return encoding
 
 
+class CachedResponse(Response):
+    """:class:`Response` rebuilt from an :class:`HTTPCache` entry."""
+
+    def __init__(self, request, entry, content):
+        """Create new :class:`CachedResponse`.
+
+        :param request: :class:`urllib2.Request` instance
+        :param entry: metadata :class:`dict` from :class:`HTTPCache`
+        :param content: cached body of the response
+        :type content: ``str``
+
+        """
+        self.request = request
+        self._stream = False
+        self._encoding = None
+        self.error = None
+        self.url = entry['url']
+        self.status_code = entry['status']
+        self.reason = RESPONSES.get(self.status_code)
+        self._content = None
+        self._content_loaded = False
+        self._gzipped = False
+        self.from_cache = True
+
+        headers = mimetools.Message(StringIO(entry['headers']))
+        self.raw = urllib.addinfourl(StringIO(content), headers, self.url)
+        self.transfer_encoding = headers.getencoding()
+        self.mimetype = headers.gettype()
+        self.headers = CaseInsensitiveDictionary()
+        for key in headers.keys():
+            self.headers[key.lower()] = headers.get(key)
+
+
+class HTTPCache(object):
+    """On-disk cache for responses to GET requests.
+
+    Pass an instance as the ``cache`` argument of :func:`get` or
+    :func:`request`. Cached responses that are still fresh according to
+    their ``Cache-Control``, ``Expires`` or ``Last-Modified`` headers
+    are returned without contacting the server. Stale responses with an
+    ``ETag`` or ``Last-Modified`` header are revalidated with a
+    conditional request, and if the server answers ``304 Not Modified``,
+    the cached body is returned.
+
+    Only ``200`` responses are cached, and never if the server sends
+    ``Cache-Control: no-store`` or ``Vary: *``.
+
+    :param dirpath: directory to store cached responses in
+    :type dirpath: ``unicode``
+
+    """
+
+    def __init__(self, dirpath):
+        """Create new :class:`HTTPCache` in ``dirpath``."""
+        self.dirpath = dirpath
+        if not os.path.exists(dirpath):
+            os.makedirs(dirpath)
+
+    def lookup(self, url):
+        """Return cache metadata for ``url`` or ``None``.
+
+        :param url: full URL of request (including query string)
+        :type url: ``str``
+        :returns: :class:`dict` with the keys ``url``, ``status``,
+            ``headers`` and ``stored`` or ``None``
+
+        """
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, 'rb') as file_obj:
+                entry = json.load(file_obj)
+        except (IOError, ValueError):
+            return None
+        if not os.path.exists(body_path):
+            return None
+        return entry
+
+    def is_fresh(self, entry):
+        """Whether cached ``entry`` can be used without revalidation."""
+        age = time.time() - entry['stored']
+        return age < self._lifetime(entry)
+
+    def validators(self, entry):
+        """Return conditional request headers for ``entry``."""
+        headers = mimetools.Message(StringIO(entry['headers']))
+        validators = {}
+        if headers.get('etag'):
+            validators['If-None-Match'] = headers.get('etag')
+        if headers.get('last-modified'):
+            validators['If-Modified-Since'] = headers.get('last-modified')
+        return validators
+
+    def response(self, request, entry):
+        """Return a :class:`CachedResponse` for ``entry``."""
+        with open(self._paths(entry['url'])[1], 'rb') as file_obj:
+            content = file_obj.read()
+        return CachedResponse(request, entry, content)
+
+    def store(self, url, response):
+        """Cache ``response`` to a GET request for ``url``.
+
+        Reads the response's content if it hasn't been read yet.
+
+        :returns: ``True`` if ``response`` was cached
+
+        """
+        if response.status_code != 200 or response.stream:
+            return False
+
+        headers = response.raw.info()
+        cache_control = _parse_cache_control(headers.get('cache-control'))
+        if 'no-store' in cache_control or headers.get('vary') == '*':
+            return False
+
+        # The body is stored decompressed
+        lines = [line for line in headers.headers
+                 if not line.lower().startswith(('content-encoding:',
+                                                 'content-length:',
+                                                 'transfer-encoding:'))]
+        entry = {
+            'url': url,
+            'status': response.status_code,
+            'headers': ''.join(lines),
+            'stored': time.time(),
+        }
+        meta_path, body_path = self._paths(url)
+        self._write(body_path, response.content)
+        self._write(meta_path, json.dumps(entry))
+        return True
+
+    def refresh(self, entry, response):
+        """Update ``entry`` from a ``304 Not Modified`` ``response``.
+
+        :returns: ``entry`` with updated headers and storage time
+
+        """
+        headers = mimetools.Message(StringIO(entry['headers']))
+        if response.error is not None:
+            new_headers = response.error.info()
+            for key in ('cache-control', 'date', 'etag', 'expires',
+                        'last-modified'):
+                if new_headers.get(key):
+                    headers[key] = new_headers.get(key)
+
+        entry = dict(entry)
+        entry['headers'] = ''.join(headers.headers)
+        entry['stored'] = time.time()
+        self._write(self._paths(entry['url'])[0], json.dumps(entry))
+        return entry
+
+    def _lifetime(self, entry):
+        """Freshness lifetime of ``entry`` in seconds (RFC 7234 4.2.1)."""
+        headers = mimetools.Message(StringIO(entry['headers']))
+        cache_control = _parse_cache_control(headers.get('cache-control'))
+
+        if 'no-cache' in cache_control:
+            return 0
+
+        if 'max-age' in cache_control:
+            try:
+                return int(cache_control['max-age'])
+            except ValueError:
+                return 0
+
+        date = _parse_http_date(headers.get('date')) or entry['stored']
+
+        expires = headers.get('expires')
+        if expires:
+            expires = _parse_http_date(expires)
+            return max(0, expires - date) if expires else 0
+
+        # Heuristic freshness: 10% of time since last modification
+        last_modified = _parse_http_date(headers.get('last-modified'))
+        if last_modified:
+            return max(0, (date - last_modified) / 10)
+
+        return 0
+
+    def _paths(self, url):
+        """Return paths of metadata and body files for ``url``."""
+        if isinstance(url, unicode):
+            url = url.encode('utf-8')
+        key = hashlib.sha1(url).hexdigest()
+        path = os.path.join(self.dirpath, key)
+        return path + '.json', path + '.body'
+
+    def _write(self, path, data):
+        """Write ``data`` to ``path`` via a temporary file."""
+        temp_path = '{0}.{1}.temp'.format(path,
+                                          threading.current_thread().ident)
+        with open(temp_path, 'wb') as file_obj:
+            file_obj.write(data)
+        os.rename(temp_path, path)
+
+
+def _parse_cache_control(value):
+    """Parse ``Cache-Control`` header into a :class:`dict`."""
+    directives = {}
+    for directive in (value or '').split(','):
+        name, _, arg = directive.strip().partition('=')
+        if name:
+            directives[name.lower()] = arg.strip('"')
+    return directives
+
+
+def _parse_http_date(value):
+    """Parse HTTP date to a UNIX timestamp or ``None``."""
+    if not value:
+        return None
+    parsed = parsedate_tz(value)
+    if parsed is None:
+        return None
+    return mktime_tz(parsed)
+
+
 def request(method, url, params=None, data=None, headers=None, cookies=None,
             files=None, auth=None, timeout=60, allow_redirects=False,
-            stream=False):
+            stream=False, cache=None):
     """Initiate an HTTP(S) request. Returns :class:`Response` object.
 
     :param method: 'GET' or 'POST'
@@ -474,12 +1007,15 @@ def request(method, url, params=None, data=None, headers=None, cookies=None,
     :type files: :class:`dict`
     :param auth: username, password
     :type auth: ``tuple``
-    :param timeout: connection timeout limit in seconds
+    :param timeout: connection timeout limit in seconds. If a
+        :class:`Deadline` is installed, it is capped at the time left.
     :type timeout: ``int``
     :param allow_redirects: follow redirections
     :type allow_redirects: ``Boolean``
     :param stream: Stream content instead of fetching it all at once.
     :type stream: ``bool``
+    :param cache: cache to answer and store GET requests with
+    :type cache: :class:`HTTPCache`
     :returns: :class:`Response` object
 
 
@@ -497,24 +1033,7 @@ def request(method, url, params=None, data=None, headers=None, cookies=None,
 
     """
     # TODO: cookies
-    socket.setdefaulttimeout(timeout)
-
-    # Default handlers
-    openers = []
-
-    if not allow_redirects:
-        openers.append(NoRedirectHandler())
-
-    if auth is not None:  # Add authorisation handler
-        username, password = auth
-        password_manager = urllib2.HTTPPasswordMgrWithDefaultRealm()
-        password_manager.add_password(None, url, username, password)
-        auth_manager = urllib2.HTTPBasicAuthHandler(password_manager)
-        openers.append(auth_manager)
-
-    # Install our custom chain of openers
-    opener = urllib2.build_opener(*openers)
-    urllib2.install_opener(opener)
+    opener = _get_opener(url, auth, allow_redirects)
 
     if not headers:
         headers = CaseInsensitiveDictionary()
@@ -563,12 +1082,66 @@ def request(method, url, params=None, data=None, headers=None, cookies=None,
         query = urllib.urlencode(str_dict(params), doseq=True)
         url = urlparse.urlunsplit((scheme, netloc, path, query, fragment))
 
+    entry = None
+    if cache is not None and method == 'GET':
+        entry = cache.lookup(url)
+        if entry is not None:
+            if cache.is_fresh(entry):
+                return cache.response(urllib2.Request(url, data, headers),
+                                      entry)
+            headers.update(str_dict(cache.validators(entry)))
+
+    deadline = _deadline
+    if deadline is not None:
+        if deadline.expired:
+            raise DeadlineExceeded('Time budget exhausted before request '
+                                   'to {0}'.format(url))
+        timeout = deadline.timeout(timeout)
+
     req = urllib2.Request(url, data, headers)
-    return Response(req, stream)
+    response = Response(req, stream, opener, timeout)
+
+    if cache is not None and method == 'GET':
+        if response.status_code == 304 and entry is not None:
+            return cache.response(req, cache.refresh(entry, response))
+        cache.store(url, response)
+
+    return response
+
+
+# Openers without authorisation, keyed by `allow_redirects`
+_openers = {}
+
+
+def _get_opener(url, auth, allow_redirects):
+    """Return a :class:`urllib2.OpenerDirector` using :data:`connection_pool`.
+
+    Openers are built once and re-used unless ``auth`` is set.
+
+    """
+    if auth is None and allow_redirects in _openers:
+        return _openers[allow_redirects]
+
+    handlers = [KeepAliveHandler(connection_pool)]
+
+    if not allow_redirects:
+        handlers.append(NoRedirectHandler())
+
+    if auth is not None:  # Add authorisation handler
+        username, password = auth
+        password_manager = urllib2.HTTPPasswordMgrWithDefaultRealm()
+        password_manager.add_password(None, url, username, password)
+        auth_manager = urllib2.HTTPBasicAuthHandler(password_manager)
+        handlers.append(auth_manager)
+
+    opener = urllib2.build_opener(*handlers)
+    if auth is None:
+        _openers[allow_redirects] = opener
+    return opener
 
 
 def get(url, params=None, headers=None, cookies=None, auth=None,
-        timeout=60, allow_redirects=True, stream=False):
+        timeout=60, allow_redirects=True, stream=False, cache=None):
     """Initiate a GET request. Arguments as for :func:`request`.
 
     :returns: :class:`Response` instance
@@ -576,7 +1149,7 @@ def get(url, params=None, headers=None, cookies=None, auth=None,
     """
     return request('GET', url, params, headers=headers, cookies=cookies,
                    auth=auth, timeout=timeout, allow_redirects=allow_redirects,
-                   stream=stream)
+                   stream=stream, cache=cache)
 
 
 def post(url, params=None, data=None, headers=None, cookies=None, files=None,
@@ -590,6 +1163,78 @@ def post(url, params=None, data=None, headers=None, cookies=None, files=None,
                    timeout, allow_redirects, stream)
 
 
+def get_many(requests, timeout=60, deadline=None, max_workers=MAX_WORKERS):
+    """Make several GET requests concurrently.
+
+    Returns a list with one :class:`Response` per request, in the same
+    order as ``requests``. Requests that raise an exception or are still
+    running when ``deadline`` expires are ``None`` in the list.
+    Exceptions are logged at debug level.
+
+    Unless a request is made with ``stream=True``, its content is read
+    by the worker thread, so ``Response.content`` doesn't block.
+
+    :param requests: URLs and/or :class:`dict` objects of keyword
+        arguments for :func:`get` (``{'url': ..., 'params': ...}``)
+    :type requests: ``list``
+    :param timeout: connection timeout limit in seconds for requests
+        that don't specify their own
+    :type timeout: ``int``
+    :param deadline: seconds to wait for all requests to finish.
+        ``None`` means wait for all of them. Capped at the time left in
+        the :class:`Deadline` installed with :func:`set_deadline`.
+    :type deadline: ``float``
+    :param max_workers: maximum number of requests to run at once
+    :type max_workers: ``int``
+    :returns: ``list`` of :class:`Response` objects and/or ``None``
+
+    """
+    results = [None] * len(requests)
+    jobs = Queue()
+    for i, req in enumerate(requests):
+        if isinstance(req, basestring):
+            req = {'url': req}
+        kwargs = dict(req)
+        kwargs.setdefault('timeout', timeout)
+        jobs.put((i, kwargs))
+
+    def worker():
+        while True:
+            try:
+                i, kwargs = jobs.get_nowait()
+            except Empty:
+                return
+            try:
+                r = get(**kwargs)
+                if not r.stream and not r.error:
+                    r.content
+                results[i] = r
+            except Exception:
+                _log.debug('get_many: request to %s failed',
+                           kwargs.get('url'), exc_info=True)
+
+    threads = []
+    for _ in range(min(max_workers, len(requests))):
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+
+    if _deadline is not None:
+        deadline = _deadline.timeout(deadline)
+
+    if deadline is not None:
+        deadline += time.time()
+
+    for thread in threads:
+        if deadline is None:
+            thread.join()
+        else:
+            thread.join(max(0, deadline - time.time()))
+
+    return list(results)
+
+
 def encode_multipart_formdata(fields, files):
     """Encode form data (``fields``) and ``files`` for POST request.
 
@@ -21,14 +21,19 @@ up your Python script to best utilise the :class:`Workflow` object.
 
 from __future__ import print_function, unicode_literals
 
+from array import array
 import binascii
 from contextlib import contextmanager
 import cPickle
 from copy import deepcopy
 import errno
+import fcntl
+import heapq
+from io import BytesIO
 import json
 import logging
 import logging.handlers
+import multiprocessing
 import os
 import pickle
 import plistlib
@@ -36,10 +41,22 @@ import re
 import shutil
 import signal
 import string
+import struct
 import subprocess
 import sys
 import time
 import unicodedata
+import zlib
+
+try:
+    import lz4.block
+except ImportError:  # pragma: no cover
+    lz4 = None
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
 
 try:
     import xml.etree.cElementTree as ET
@@ -51,6 +68,10 @@ except ImportError:  # pragma: no cover
 #: correctly have the value ``None``)
 UNSET = object()
 
+#: Seconds :meth:`Workflow.revalidate` waits before refreshing a cache
+#: again if the last refresh left it stale (e.g. because it failed)
+REVALIDATE_BACKOFF = 60
+
 ####################################################################
 # Standard system icons
 ####################################################################
@@ -404,6 +425,13 @@ DUMB_PUNCTUATION = {
 # Used by `Workflow.filter`
 ####################################################################
 
+# Smallest number of items `Workflow.filter` splits across processes
+PARALLEL_MIN_ITEMS = 10000
+
+# What the processes of a parallel `Workflow.filter` work on. Set before
+# the process pool is forked, so it needn't be pickled
+_filter_job = None
+
 # Anchor characters in a name
 #: Characters that indicate the beginning of a "word" in CamelCase
 INITIALS = string.ascii_uppercase + string.digits
@@ -432,6 +460,12 @@ MATCH_ALLCHARS = 64
 #: Combination of all other ``MATCH_*`` constants
 MATCH_ALL = 127
 
+# Rules under which an item matching a query also matches every prefix
+# of that query. MATCH_ATOM doesn't qualify on its own, but an atom is
+# also a substring and a match for MATCH_ALLCHARS
+PREFIX_CLOSED_RULES = (MATCH_STARTSWITH | MATCH_CAPITALS | MATCH_INITIALS |
+                       MATCH_SUBSTRING | MATCH_ALLCHARS)
+
 
 ####################################################################
 # Used by `Workflow.check_update`
@@ -440,6 +474,16 @@ MATCH_ALL = 127
 # Number of days to wait between checking for updates to the workflow
 DEFAULT_UPDATE_FREQUENCY = 1
 
+# Settings read on (almost) every run. They are kept in a small snapshot
+# in the cache directory, so runs that don't otherwise use
+# `Workflow.settings` never load the settings file
+SNAPSHOT_SETTINGS = (
+    '__workflow_autoupdate',
+    '__workflow_diacritic_folding',
+    '__workflow_last_version',
+    '__workflow_prereleases',
+)
+
 
 ####################################################################
 # Lockfile and Keychain access errors
@@ -495,6 +539,65 @@ def isascii(text):
     return True
 
 
+def fold_to_ascii(text):
+    """Convert non-ASCII characters to closest ASCII equivalent.
+
+    See :meth:`Workflow.fold_to_ascii`.
+
+    """
+    if isascii(text):
+        return text
+    text = ''.join([ASCII_REPLACEMENTS.get(c, c) for c in text])
+    return unicode(unicodedata.normalize('NFKD',
+                   text).encode('ascii', 'ignore'))
+
+
+def key_fingerprint(values):
+    """Return ``(count, crc32)`` of search keys ``values``."""
+    count = 0
+    crc = 0
+    for value in values:
+        crc = binascii.crc32(value.encode('utf-8') + b'\0', crc)
+        count += 1
+    return (count, crc)
+
+
+def encode_codes(texts):
+    """Return NumPy array of ``texts``' code points, one row per text."""
+    # NumPy stores unicode as fixed-width UCS4 on all platforms
+    codes = numpy.array(texts, dtype=numpy.unicode_).view(numpy.uint32)
+    return codes.reshape(len(texts), -1)
+
+
+def codes_match(codes, text, anywhere=False):
+    """Return which rows of ``codes`` start with (or contain) ``text``."""
+    text = encode_codes([text])[0]
+    size = len(text)
+    hits = numpy.zeros(len(codes), dtype=bool)
+    if size > codes.shape[1]:  # longer than every row
+        return hits
+
+    last = codes.shape[1] - size + 1 if anywhere else 1
+    for start in range(last):
+        hits |= (codes[:, start:start + size] == text).all(axis=1)
+
+    return hits
+
+
+def char_mask(text):
+    """Return bitmask of the characters in ``text``.
+
+    Each character sets bit ``ord(c) % 64``. If the mask of ``a`` has a
+    bit that isn't set in the mask of ``b``, ``a`` contains a character
+    that ``b`` doesn't.
+
+    """
+    mask = 0
+    for c in set(text):
+        mask |= 1 << (ord(c) & 63)
+    return mask
+
+
 ####################################################################
 # Implementation classes
 ####################################################################
@@ -695,11 +798,137 @@ class PickleSerializer(object):
         return pickle.dump(obj, file_obj, protocol=-1)
 
 
+class CompactJSONSerializer(object):
+    """Wrapper around :mod:`json` without any whitespace.
+
+    Files are a fraction of the size of those written by
+    :class:`JSONSerializer` and quicker to write and parse.
+
+    """
+
+    @classmethod
+    def load(cls, file_obj):
+        """Load serialized object from open JSON file.
+
+        :param file_obj: file handle
+        :type file_obj: ``file`` object
+        :returns: object loaded from JSON file
+        :rtype: object
+
+        """
+        return json.load(file_obj)
+
+    @classmethod
+    def dump(cls, obj, file_obj):
+        """Serialize object ``obj`` to open JSON file.
+
+        :param obj: Python object to serialize
+        :type obj: JSON-serializable data structure
+        :param file_obj: file handle
+        :type file_obj: ``file`` object
+
+        """
+        return json.dump(obj, file_obj, separators=(',', ':'),
+                         encoding='utf-8')
+
+
+class BinarySerializer(object):
+    """Length-prefixed, optionally compressed :mod:`cPickle` data.
+
+    Files start with a header of the magic bytes ``AWB1``, the
+    compression used (``0`` none, ``1`` zlib, ``2`` lz4) and the length
+    of the uncompressed payload, which is checked on loading, so a
+    truncated file raises an exception instead of returning partial
+    data. Any file in this format can be loaded regardless of
+    the ``compression`` of the serializer loading it.
+
+    :param compression: ``None``, ``'zlib'`` or ``'lz4'`` (requires
+        the ``lz4`` package)
+    :param level: zlib compression level
+
+    """
+
+    magic = b'AWB1'
+    header = struct.Struct(b'>4sBQ')
+    codecs = {None: 0, 'zlib': 1, 'lz4': 2}
+
+    def __init__(self, compression=None, level=1):
+        """Create new :class:`BinarySerializer` object."""
+        if compression not in self.codecs:
+            raise ValueError('Unknown compression : {0!r}'.format(
+                             compression))
+        if compression == 'lz4' and lz4 is None:
+            raise ValueError('lz4 compression requires the lz4 package')
+
+        self.codec = self.codecs[compression]
+        self.level = level
+
+    def load(self, file_obj):
+        """Load serialized object from open file.
+
+        :param file_obj: file handle
+        :type file_obj: ``file`` object
+        :returns: object loaded from file
+        :rtype: object
+
+        """
+        return self.loads(file_obj.read())
+
+    def dump(self, obj, file_obj):
+        """Serialize object ``obj`` to open file.
+
+        :param obj: Python object to serialize
+        :type obj: Python object
+        :param file_obj: file handle
+        :type file_obj: ``file`` object
+
+        """
+        payload = cPickle.dumps(obj, protocol=-1)
+        file_obj.write(self.header.pack(self.magic, self.codec,
+                                        len(payload)))
+
+        if self.codec == 1:
+            payload = zlib.compress(payload, self.level)
+        elif self.codec == 2:
+            payload = lz4.block.compress(payload, store_size=False)
+
+        file_obj.write(payload)
+
+    def loads(self, data, offset=0):
+        """Load object from serialized ``data`` starting at ``offset``."""
+        magic, codec, size = self.header.unpack_from(data, offset)
+        if magic != self.magic:
+            raise ValueError('Not a binary serializer file')
+
+        start = offset + self.header.size
+        if codec == 0:
+            payload = data[start:start + size]
+        elif codec == 1:
+            payload = zlib.decompress(data[start:])
+        elif codec == 2:
+            if lz4 is None:
+                raise ValueError('lz4 compression requires the lz4 package')
+            payload = lz4.block.decompress(data[start:],
+                                           uncompressed_size=size)
+        else:
+            raise ValueError('Unknown compression : {0}'.format(codec))
+
+        if len(payload) != size:
+            raise ValueError('Truncated binary serializer file')
+
+        return cPickle.loads(payload)
+
+
 # Set up default manager and register built-in serializers
 manager = SerializerManager()
 manager.register('cpickle', CPickleSerializer)
 manager.register('pickle', PickleSerializer)
 manager.register('json', JSONSerializer)
+manager.register('cjson', CompactJSONSerializer)
+manager.register('bin', BinarySerializer())
+manager.register('zbin', BinarySerializer('zlib'))
+if lz4 is not None:
+    manager.register('lz4bin', BinarySerializer('lz4'))
 
 
 class Item(object):
@@ -796,13 +1025,25 @@ class Item(object):
 
 
 class LockFile(object):
-    """Context manager to create lock files."""
+    """Context manager to create lock files.
 
-    def __init__(self, protected_path, timeout=0, delay=0.05):
+    The lock is an :func:`fcntl.flock` lock on ``protected_path.lock``,
+    so it is released by the operating system if the process holding it
+    dies. The lock file itself is left in place.
+
+    If ``shared`` is ``True``, the lock may be held by several processes
+    at once (e.g. readers), but not at the same time as an exclusive
+    lock.
+
+    """
+
+    def __init__(self, protected_path, timeout=0, delay=0.05, shared=False):
         """Create new :class:`LockFile` object."""
         self.lockfile = protected_path + '.lock'
         self.timeout = timeout
         self.delay = delay
+        self.shared = shared
+        self._fd = None
         self._locked = False
 
     @property
@@ -816,33 +1057,43 @@ class LockFile(object):
         If the lock is in use and ``blocking`` is ``False``, return
         ``False``.
 
-        Otherwise, check every `self.delay` seconds until it acquires
-        lock or exceeds `self.timeout` and raises an exception.
+        Otherwise, wait until the lock is free. If `self.timeout` is set,
+        check every `self.delay` seconds until it acquires lock or exceeds
+        `self.timeout` and raises an exception.
 
         """
+        mode = fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX
+        if not blocking or self.timeout:
+            mode |= fcntl.LOCK_NB
+
+        fd = os.open(self.lockfile, os.O_CREAT | os.O_RDWR)
         start = time.time()
         while True:
             try:
-                fd = os.open(self.lockfile, os.O_CREAT | os.O_EXCL | os.O_RDWR)
-                with os.fdopen(fd, 'w') as fd:
-                    fd.write('{0}'.format(os.getpid()))
+                fcntl.flock(fd, mode)
                 break
-            except OSError as err:
-                if err.errno != errno.EEXIST:  # pragma: no cover
+            except IOError as err:
+                if err.errno not in (errno.EAGAIN, errno.EACCES):
+                    os.close(fd)
                     raise
                 if self.timeout and (time.time() - start) >= self.timeout:
+                    os.close(fd)
                     raise AcquisitionError('Lock acquisition timed out.')
                 if not blocking:
+                    os.close(fd)
                     return False
                 time.sleep(self.delay)
 
+        self._fd = fd
         self._locked = True
         return True
 
     def release(self):
-        """Release the lock by deleting `self.lockfile`."""
+        """Release the lock."""
         self._locked = False
-        os.unlink(self.lockfile)
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
 
     def __enter__(self):
         """Acquire lock."""
@@ -887,6 +1138,156 @@ def atomic_writer(file_path, mode):
                 pass
 
 
+class SQLiteStore(object):
+    """Key-value store for cached or stored data in a single SQLite file.
+
+    Set :attr:`Workflow.cache_store` or :attr:`Workflow.data_store` to
+    an instance to keep all the workflow's datastores in one indexed
+    file instead of one (or two) files per name. Each entry is written
+    atomically in its own transaction and records the name of the
+    serializer used, when it was saved and, optionally, when it expires
+    (see the ``ttl`` argument of :meth:`Workflow.cache_data`), so old
+    entries can be evicted in bulk with :meth:`evict`.
+    :meth:`Workflow.run` evicts expired entries from
+    :attr:`Workflow.cache_store` if the store was used during the run.
+
+    The database is opened lazily in WAL mode, so a background process
+    can update the store while a Script Filter is reading it.
+
+    :param filepath: path of the database file
+    :type filepath: ``unicode``
+    :param timeout: seconds to wait for another process's write to
+        finish
+    :type timeout: ``float``
+
+    """
+
+    def __init__(self, filepath, timeout=5.0):
+        """Create new :class:`SQLiteStore` object."""
+        self.filepath = filepath
+        self.timeout = timeout
+        self._conn = None
+
+    @property
+    def conn(self):
+        """Open :class:`sqlite3.Connection` to the store."""
+        if self._conn is None:
+            import sqlite3
+
+            conn = sqlite3.connect(self.filepath, timeout=self.timeout)
+            conn.text_factory = unicode
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS entries ('
+                    'name TEXT PRIMARY KEY, '
+                    'serializer TEXT NOT NULL, '
+                    'value BLOB NOT NULL, '
+                    'size INTEGER NOT NULL, '
+                    'updated REAL NOT NULL, '
+                    'expires REAL)')
+                conn.execute('CREATE INDEX IF NOT EXISTS entries_updated '
+                             'ON entries (updated)')
+                conn.execute('CREATE INDEX IF NOT EXISTS entries_expires '
+                             'ON entries (expires)')
+            self._conn = conn
+        return self._conn
+
+    @property
+    def is_open(self):
+        """``True`` if the database has been opened."""
+        return self._conn is not None
+
+    def stat(self, name):
+        """Return ``(updated, size, rowid)`` of entry ``name`` or ``None``.
+
+        ``rowid`` changes every time the entry is saved.
+
+        """
+        return self.conn.execute(
+            'SELECT updated, size, rowid FROM entries WHERE name = ?',
+            (name,)).fetchone()
+
+    def get(self, name):
+        """Return ``(serializer, value)`` of entry ``name`` or ``None``."""
+        row = self.conn.execute(
+            'SELECT serializer, value FROM entries WHERE name = ?',
+            (name,)).fetchone()
+        if row is None:
+            return None
+        return row[0], bytes(row[1])
+
+    def set(self, name, serializer, value, ttl=None):
+        """Save serialized ``value`` under ``name``.
+
+        :param name: name of entry
+        :param serializer: name of serializer ``value`` was created with
+        :param value: serialized data
+        :type value: ``str``
+        :param ttl: seconds after which :meth:`evict` may delete the
+            entry. If ``None``, the entry doesn't expire.
+        :type ttl: ``int``
+
+        """
+        import sqlite3
+
+        now = time.time()
+        expires = now + ttl if ttl is not None else None
+        with self.conn as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO entries '
+                '(name, serializer, value, size, updated, expires) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (name, serializer, sqlite3.Binary(value), len(value),
+                 now, expires))
+
+    def delete(self, name):
+        """Delete entry ``name`` if it exists."""
+        with self.conn as conn:
+            conn.execute('DELETE FROM entries WHERE name = ?', (name,))
+
+    def names(self):
+        """Return names of all entries, oldest first."""
+        return [row[0] for row in self.conn.execute(
+                'SELECT name FROM entries ORDER BY updated')]
+
+    def evict(self, max_age=None):
+        """Delete expired entries in one transaction.
+
+        :param max_age: also delete entries saved more than this many
+            seconds ago
+        :type max_age: ``int``
+        :returns: number of entries deleted
+        :rtype: ``int``
+
+        """
+        now = time.time()
+        if max_age is None and self.conn.execute(
+                'SELECT 1 FROM entries WHERE expires < ? LIMIT 1',
+                (now,)).fetchone() is None:
+            return 0  # don't start a write transaction for nothing
+
+        with self.conn as conn:
+            count = conn.execute(
+                'DELETE FROM entries WHERE expires < ?', (now,)).rowcount
+            if max_age is not None:
+                count += conn.execute(
+                    'DELETE FROM entries WHERE updated < ?',
+                    (now - max_age,)).rowcount
+        return count
+
+    def clear(self):
+        """Delete all entries."""
+        with self.conn as conn:
+            conn.execute('DELETE FROM entries')
+
+    def close(self):
+        """Close the database. It is re-opened when next needed."""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
 class uninterruptible(object):
     """Decorator that postpones SIGTERM until wrapped function is complete.
 
@@ -961,57 +1362,87 @@ class Settings(dict):
     An appropriate instance is provided by :class:`Workflow` instances at
     :attr:`Workflow.settings`.
 
+    Changes are only written if the settings differ from what is in the
+    file. Set :attr:`autosave` to ``False`` or use :meth:`batch` to
+    combine several changes into a single write.
+
     """
 
     def __init__(self, filepath, defaults=None):
         """Create new :class:`Settings` object."""
         super(Settings, self).__init__()
         self._filepath = filepath
-        self._nosave = False
-        self._original = {}
+        #: Whether to save the settings after every change. If ``False``,
+        #: changes are kept until :meth:`flush` is called.
+        self.autosave = True
+        # Contents of the settings file as last loaded or saved
+        self._saved = {}
         if os.path.exists(self._filepath):
             self._load()
         elif defaults:
-            for key, val in defaults.items():
-                self[key] = val
-            self.save()  # save default settings
+            self.update(defaults)  # save default settings
 
     def _load(self):
         """Load cached settings from JSON file `self._filepath`."""
-        self._nosave = True
-        d = {}
         with open(self._filepath, 'rb') as file_obj:
-            for key, value in json.load(file_obj, encoding='utf-8').items():
-                d[key] = value
-        self.update(d)
-        self._original = deepcopy(d)
-        self._nosave = False
+            data = json.load(file_obj, encoding='utf-8')
+        super(Settings, self).update(data)
+        self._saved = deepcopy(data)
+
+    @property
+    def dirty(self):
+        """``True`` if there are changes that haven't been saved."""
+        return self != self._saved
+
+    @contextmanager
+    def batch(self):
+        """Context manager that saves all changes made in it at once.
+
+        Batches may be nested. Changes are saved when the outermost
+        batch exits, unless :attr:`autosave` was already ``False``.
+
+        """
+        autosave = self.autosave
+        self.autosave = False
+        try:
+            yield self
+        finally:
+            self.autosave = autosave
+            self.save()
 
-    @uninterruptible
     def save(self):
         """Save settings to JSON file specified in ``self._filepath``.
 
         If you're using this class via :attr:`Workflow.settings`, which
         you probably are, ``self._filepath`` will be ``settings.json``
         in your workflow's data directory (see :attr:`~Workflow.datadir`).
+
+        Does nothing if :attr:`autosave` is ``False``. Use :meth:`flush`
+        to save regardless.
         """
-        if self._nosave:
+        if self.autosave:
+            self.flush()
+
+    @uninterruptible
+    def flush(self):
+        """Save settings now if they have changed since the last save."""
+        if not self.dirty:
             return
         data = {}
         data.update(self)
-        # for key, value in self.items():
-        #     data[key] = value
         with LockFile(self._filepath):
             with atomic_writer(self._filepath, 'wb') as file_obj:
                 json.dump(data, file_obj, sort_keys=True, indent=2,
                           encoding='utf-8')
+                file_obj.flush()
+                os.fsync(file_obj.fileno())
+        self._saved = deepcopy(data)
 
     # dict methods
     def __setitem__(self, key, value):
         """Implement :class:`dict` interface."""
-        if self._original.get(key) != value:
-            super(Settings, self).__setitem__(key, value)
-            self.save()
+        super(Settings, self).__setitem__(key, value)
+        self.save()
 
     def __delitem__(self, key):
         """Implement :class:`dict` interface."""
@@ -1030,6 +1461,167 @@ class Settings(dict):
         return ret
 
 
+class SearchKey(object):
+    """Search key of an item in the forms used by :meth:`Workflow.filter`.
+
+    Properties that are only needed by some ``MATCH_*`` rules are
+    computed on first use, or all at once by :meth:`precompute`.
+
+    :param value: search key (diacritics already folded if required)
+    :type value: ``unicode``
+
+    """
+
+    __slots__ = ('value', 'lower', 'chars', 'mask', '_capitals', '_atoms',
+                 '_initials')
+
+    def __init__(self, value):
+        """Create new :class:`SearchKey` object."""
+        self.value = value
+        self.lower = value.lower()
+        self.chars = frozenset(self.lower)
+        self.mask = None
+        self._capitals = None
+        self._atoms = None
+        self._initials = None
+
+    @property
+    def capitals(self):
+        """Capital letters and digits in :attr:`value`."""
+        if self._capitals is None:
+            self._capitals = ''.join([c for c in self.value if c in INITIALS])
+        return self._capitals
+
+    @property
+    def atoms(self):
+        """Lower-case words in :attr:`value`."""
+        if self._atoms is None:
+            self._atoms = [s.lower() for s in split_on_delimiters(self.value)]
+        return self._atoms
+
+    @property
+    def initials(self):
+        """First letters of :attr:`atoms`."""
+        if self._initials is None:
+            self._initials = ''.join([s[0] for s in self.atoms if s])
+        return self._initials
+
+    def precompute(self):
+        """Compute all properties now."""
+        self.mask = char_mask(self.lower)
+        self.capitals
+        self.initials
+
+
+class FilterIndex(object):
+    """Items and their search keys, prepared for :meth:`Workflow.filter`.
+
+    Pass a :class:`FilterIndex` as ``items`` to :meth:`Workflow.filter`
+    to filter the same items repeatedly (e.g. once per keystroke) without
+    re-computing their search keys each time. The keys are lower-cased,
+    folded to ASCII and split into atoms, capitals and initials once,
+    when the index is created.
+
+    :param items: items to search
+    :type items: ``list`` or ``tuple``
+    :param key: function to get comparison key from ``items``.
+        Must return a ``unicode`` string. The default simply returns
+        the item.
+    :type key: ``callable``
+    :param vectorize: Also encode the keys as NumPy arrays, so that
+        :meth:`Workflow.filter` can discard non-matching items and score
+        ``MATCH_STARTSWITH`` matches for all items at once. Ignored if
+        NumPy isn't installed.
+    :type vectorize: ``Boolean``
+
+    """
+
+    def __init__(self, items, key=lambda x: x, vectorize=True):
+        """Create new :class:`FilterIndex` object."""
+        #: Indexed items
+        self.items = list(items)
+        #: ``(item, value, plain, folded)`` for each item with a
+        #: non-empty search key. ``plain`` and ``folded`` are
+        #: :class:`SearchKey` objects for the key as-is and folded to
+        #: ASCII (the same object if the key is ASCII).
+        self.entries = []
+        self._fingerprint = None
+
+        for item in self.items:
+            value = key(item).strip()
+            if value == '':
+                continue
+
+            plain = SearchKey(value)
+            plain.precompute()
+            if isascii(value):
+                folded = plain
+            else:
+                folded = SearchKey(fold_to_ascii(value))
+                folded.precompute()
+
+            self.entries.append((item, value, plain, folded))
+
+        #: ``{'plain': (codes, masks, lengths), 'folded': ...}`` NumPy
+        #: arrays of :attr:`entries`' search keys, or ``None``. ``codes``
+        #: holds the lower-case keys' code points, one row per key,
+        #: padded with zeroes.
+        self.columns = None
+        if vectorize and numpy is not None and self.entries:
+            self.columns = {}
+            for name, i in (('plain', 2), ('folded', 3)):
+                keys = [entry[i] for entry in self.entries]
+                self.columns[name] = (
+                    encode_codes([k.lower for k in keys]),
+                    numpy.array([k.mask for k in keys], dtype=numpy.uint64),
+                    numpy.array([len(k.value) for k in keys],
+                                dtype=numpy.int64))
+
+    def __len__(self):
+        """Number of indexed items."""
+        return len(self.items)
+
+    @property
+    def fingerprint(self):
+        """Checksum of the search keys, used by filter sessions."""
+        if self._fingerprint is None:
+            self._fingerprint = key_fingerprint(
+                entry[1] for entry in self.entries)
+        return self._fingerprint
+
+
+def _filter_shard(shard):
+    """Filter a shard of a parallel :meth:`Workflow.filter` call.
+
+    Runs in a pool process. ``shard`` is the ``(start, stop)`` slice of
+    the job's candidate positions to filter.
+
+    :returns: ``(results, matched)``. ``results`` are the best
+        ``(sort key, (position, score, rule))`` matches, in order.
+        ``matched`` are the positions of the items matching all words,
+        or ``None`` if the filter has no session.
+
+    """
+    wf, entries, positions, args, session = _filter_job
+    (words, terms, match_on, fold_diacritics, known,
+     min_score, max_results, ascending) = args
+    matched = array(b'i') if session else None
+
+    # Pair items with their positions. Matches are still ordered by the
+    # items first, as in the serial filter, and equal items keep their
+    # order (the serial sort is stable), so the merged results are the
+    # same
+    order = -1 if ascending else 1
+    candidates = ((pos, ((entries[pos][0], pos * order),) + entries[pos][1:])
+                  for pos in positions[shard[0]:shard[1]])
+    matches = wf._filter_matches(candidates, words, terms, match_on,
+                                 fold_diacritics, matched, known)
+    results = wf._filter_select(matches, min_score, max_results, ascending)
+
+    return ([(sort_key, (item[1] * order, score, rule))
+             for sort_key, (item, score, rule) in results], matched)
+
+
 class Workflow(object):
     """Create new :class:`Workflow` instance.
 
@@ -1101,6 +1693,28 @@ class Workflow(object):
         self._last_version_run = UNSET
         # Cache for regex patterns created for filter keys
         self._search_pattern_cache = {}
+        # Data loaded by `cached_data`, keyed by cache file path. Values
+        # are `((mtime, size, inode), data)`
+        self._cache_memo = {}
+        # Hot settings and update status. See `_load_snapshot`
+        self._snapshot = None
+        # Whether `run` is executing. Settings changes are saved when
+        # it finishes
+        self._running = False
+        #: :class:`SQLiteStore` (or compatible object) used by
+        #: :meth:`cached_data` and :meth:`cache_data` instead of one file
+        #: per name in :attr:`cachedir`. ``None`` means files.
+        self.cache_store = None
+        #: Store used by :meth:`stored_data` and :meth:`store_data`
+        #: instead of files in :attr:`datadir`. ``None`` means files.
+        self.data_store = None
+        #: :class:`~workflow.cache.CacheManager` that cache files are
+        #: reported to and that enforces quotas at the end of :meth:`run`.
+        #: ``None`` means cache files are not managed.
+        self.cache_manager = None
+        #: :class:`~workflow.web.Deadline` of the current :meth:`run`
+        #: if it was given a ``budget``, otherwise ``None``
+        self.deadline = None
         # Magic arguments
         #: The prefix for all magic arguments. Default is ``workflow:``
         self.magic_prefix = 'workflow:'
@@ -1591,13 +2205,82 @@ class Workflow(object):
         :rtype: :class:`~workflow.workflow.Settings` instance
 
         """
-        if not self._settings:
+        if self._settings is None:
             self.logger.debug('Reading settings from `{0}` ...'.format(
                               self.settings_path))
             self._settings = Settings(self.settings_path,
                                       self._default_settings)
+            if self._running:
+                self._settings.autosave = False
         return self._settings
 
+    def _hot_setting(self, key, default=None):
+        """Return setting ``key`` from :const:`SNAPSHOT_SETTINGS`.
+
+        If :attr:`settings` hasn't been loaded yet, the value comes from
+        the snapshot instead.
+
+        """
+        if self._settings is not None:
+            return self._settings.get(key, default)
+
+        return self._load_snapshot()['settings'].get(key, default)
+
+    def _load_snapshot(self):
+        """Return snapshot of hot settings and update status.
+
+        The snapshot is a small pickle in the cache directory. Each part
+        records the modification time of its source, i.e. the settings
+        file or the update status cache, and is re-read from that source
+        when the source has changed. Only then is the snapshot saved
+        again.
+
+        """
+        def mtime(path):
+            try:
+                return os.stat(path).st_mtime
+            except OSError:
+                return None
+
+        snapshot_path = self.cachefile('__workflow_snapshot.cpickle')
+        snapshot = self._snapshot
+        if snapshot is None:
+            try:
+                with open(snapshot_path, 'rb') as file_obj:
+                    snapshot = cPickle.load(file_obj)
+            except Exception:
+                snapshot = {}
+
+        changed = False
+
+        settings_mtime = mtime(self.settings_path)
+        if ('settings' not in snapshot or
+                snapshot['settings_mtime'] != settings_mtime):
+            settings = self.settings
+            snapshot['settings'] = dict((key, settings[key])
+                                        for key in SNAPSHOT_SETTINGS
+                                        if key in settings)
+            # Loading settings may have created the file
+            snapshot['settings_mtime'] = mtime(self.settings_path)
+            changed = True
+
+        status_mtime = mtime(self.cachefile(
+            '__workflow_update_status.{0}'.format(self.cache_serializer)))
+        if ('update_available' not in snapshot or
+                snapshot['status_mtime'] != status_mtime):
+            status = self.cached_data('__workflow_update_status',
+                                      max_age=0) or {}
+            snapshot['update_available'] = status.get('available')
+            snapshot['status_mtime'] = status_mtime
+            changed = True
+
+        if changed:
+            with atomic_writer(snapshot_path, 'wb') as file_obj:
+                cPickle.dump(snapshot, file_obj, protocol=-1)
+
+        self._snapshot = snapshot
+        return snapshot
+
     @property
     def cache_serializer(self):
         """Name of default cache serializer.
@@ -1695,6 +2378,15 @@ class Workflow(object):
         :param name: name of datastore
 
         """
+        store = self._store(name, self.data_store)
+        if store is not None:
+            entry = store.get(name)
+            if entry is None:
+                self.logger.debug('No data stored for `{0}`'.format(name))
+                return None
+
+            return self._deserialize(*entry)
+
         metadata_path = self.datafile('.{0}.alfred-workflow'.format(name))
 
         if not os.path.exists(metadata_path):
@@ -1761,6 +2453,15 @@ class Workflow(object):
 
         serializer_name = serializer or self.data_serializer
 
+        store = self._store(name, self.data_store)
+        if store is not None:
+            if data is None:
+                store.delete(name)
+            else:
+                store.set(name, serializer_name,
+                          self._serialize(serializer_name, data))
+            return
+
         # In order for `stored_data()` to be able to load data stored with
         # an arbitrary serializer, yet still have meaningful file extensions,
         # the format (i.e. extension) is saved to an accompanying file
@@ -1799,18 +2500,35 @@ class Workflow(object):
 
         self.logger.debug('Stored data saved at : {0}'.format(data_path))
 
-    def cached_data(self, name, data_func=None, max_age=60):
+    def cached_data(self, name, data_func=None, max_age=60,
+                    revalidate=None):
         """Return cached data if younger than ``max_age`` seconds.
 
         Retrieve data from cache or re-generate and re-cache data if
         stale/non-existant. If ``max_age`` is 0, return cached data no
         matter how old.
 
+        If ``revalidate`` is set and the cached data are stale, they are
+        returned immediately (stale-while-revalidate) and ``revalidate``
+        is started in the background via
+        :func:`~workflow.background.run_in_background` to refresh the
+        cache. Only one refresh per ``name`` runs at a time.
+        ``data_func`` is only called if there are no cached data at all.
+
+        Freshness is decided with a single :func:`os.stat` call, and data
+        are only deserialized again if the cache file has changed since
+        they were last loaded by this :class:`Workflow` instance.
+        Repeated calls therefore return the *same* object, so don't
+        modify it unless you also save it with :meth:`cache_data`.
+
         :param name: name of datastore
         :param data_func: function to (re-)generate data.
         :type data_func: ``callable``
         :param max_age: maximum age of cached data in seconds
         :type max_age: ``int``
+        :param revalidate: command (argument list for
+            :func:`subprocess.call`) that re-caches ``name``
+        :type revalidate: ``list``
         :returns: cached data, return value of ``data_func`` or ``None``
             if ``data_func`` is not set
 
@@ -1818,14 +2536,53 @@ class Workflow(object):
         serializer = manager.serializer(self.cache_serializer)
 
         cache_path = self.cachefile('%s.%s' % (name, self.cache_serializer))
-        age = self.cached_data_age(name)
+        store = self._store(name, self.cache_store)
+
+        if store is not None:
+            key = store.stat(name)
+        else:
+            try:
+                stat = os.stat(cache_path)
+            except OSError:
+                key = None
+            else:
+                key = (stat.st_mtime, stat.st_size, stat.st_ino)
+
+        if key is not None:
+            age = time.time() - key[0]
+            fresh = age < max_age or max_age == 0
+
+            if fresh or revalidate:
+                if not fresh:
+                    self.revalidate(name, revalidate)
+
+                if store is None and self.cache_manager is not None:
+                    self.cache_manager.hit(cache_path)
+
+                memo = self._cache_memo.get(cache_path)
+                if memo is not None and memo[0] == key:
+                    return memo[1]
+
+                if store is not None:
+                    self.logger.debug('Loading cached data `%s` from : %s',
+                                      name, store.filepath)
+                    row = store.get(name)
+                    if row is not None:
+                        data = self._deserialize(*row)
+                    else:  # deleted or evicted since `stat()`
+                        key = None
+                else:
+                    with open(cache_path, 'rb') as file_obj:
+                        self.logger.debug('Loading cached data from : %s',
+                                          cache_path)
+                        data = serializer.load(file_obj)
 
-        if (age < max_age or max_age == 0) and os.path.exists(cache_path):
+                if key is not None:
+                    self._cache_memo[cache_path] = (key, data)
+                    return data
 
-            with open(cache_path, 'rb') as file_obj:
-                self.logger.debug('Loading cached data from : %s',
-                                  cache_path)
-                return serializer.load(file_obj)
+        if store is None and self.cache_manager is not None:
+            self.cache_manager.miss(cache_path)
 
         if not data_func:
             return None
@@ -1835,7 +2592,45 @@ class Workflow(object):
 
         return data
 
-    def cache_data(self, name, data):
+    def revalidate(self, name, cmd):
+        """Refresh cache ``name`` in the background by running ``cmd``.
+
+        This is what :meth:`cached_data` does with stale data if it is
+        given ``revalidate``. Call it directly for caches you manage
+        yourself. Only one refresh per ``name`` runs at a time, and a
+        new one isn't started within :const:`REVALIDATE_BACKOFF` seconds
+        of the last one, as the cache still being stale means it failed.
+
+        :param name: name of datastore
+        :param cmd: command (argument list for :func:`subprocess.call`)
+            that re-caches ``name``
+        :type cmd: ``list``
+        :returns: ``True`` if a refresh is running
+        :rtype: ``Boolean``
+
+        """
+        from background import is_running, run_in_background
+
+        task = '__workflow_revalidate_{0}'.format(name)
+        if is_running(task):
+            return True
+
+        # Time of the last attempt
+        marker = self.cachefile(task + '.attempt')
+        if os.path.exists(marker):
+            age = time.time() - os.stat(marker).st_mtime
+            if age < REVALIDATE_BACKOFF:
+                self.logger.debug('Cache `%s` refreshed %0.0fs ago, '
+                                  'not refreshing again yet', name, age)
+                return False
+
+        with open(marker, 'wb'):
+            pass
+
+        self.logger.debug('Revalidating stale cache `%s` ...', name)
+        return not run_in_background(task, cmd)
+
+    def cache_data(self, name, data, ttl=None):
         """Save ``data`` to cache under ``name``.
 
         If ``data`` is ``None``, the corresponding cache file will be
@@ -1844,21 +2639,48 @@ class Workflow(object):
         :param name: name of datastore
         :param data: data to store. This may be any object supported by
                 the cache serializer
+        :param ttl: seconds after which the data are evicted from
+            :attr:`cache_store`. Cache files are evicted according to
+            :attr:`cache_manager` instead.
+        :type ttl: ``int``
 
         """
         serializer = manager.serializer(self.cache_serializer)
 
         cache_path = self.cachefile('%s.%s' % (name, self.cache_serializer))
+        self._cache_memo.pop(cache_path, None)
+
+        store = self._store(name, self.cache_store)
+        if store is not None:
+            if data is None:
+                store.delete(name)
+                return
+
+            store.set(name, self.cache_serializer,
+                      self._serialize(self.cache_serializer, data), ttl)
+            self._cache_memo[cache_path] = (store.stat(name), data)
+            self.logger.debug('Cached data `%s` saved in : %s',
+                              name, store.filepath)
+            return
 
         if data is None:
             if os.path.exists(cache_path):
                 os.unlink(cache_path)
                 self.logger.debug('Deleted cache file : %s', cache_path)
+            if self.cache_manager is not None:
+                self.cache_manager.forget(cache_path)
             return
 
         with atomic_writer(cache_path, 'wb') as file_obj:
             serializer.dump(data, file_obj)
 
+        stat = os.stat(cache_path)
+        self._cache_memo[cache_path] = (
+            (stat.st_mtime, stat.st_size, stat.st_ino), data)
+
+        if self.cache_manager is not None:
+            self.cache_manager.record(cache_path, stat.st_size)
+
         self.logger.debug('Cached data saved at : %s', cache_path)
 
     def cached_data_fresh(self, name, max_age):
@@ -1887,16 +2709,59 @@ class Workflow(object):
         :rtype: ``int``
 
         """
+        store = self._store(name, self.cache_store)
+        if store is not None:
+            stat = store.stat(name)
+            if stat is None:
+                return 0
+            return time.time() - stat[0]
+
         cache_path = self.cachefile('%s.%s' % (name, self.cache_serializer))
 
-        if not os.path.exists(cache_path):
+        try:
+            return time.time() - os.stat(cache_path).st_mtime
+        except OSError:
             return 0
 
-        return time.time() - os.stat(cache_path).st_mtime
+    def _store(self, name, store):
+        """Return ``store`` unless ``name`` must be saved as a file.
+
+        Alfred-Workflow's own ``__workflow_*`` datastores are shared with
+        helper processes that don't know about the store, so they are
+        always files.
+
+        """
+        if store is None or name.startswith('__workflow_'):
+            return None
+        return store
+
+    def _serialize(self, serializer_name, data):
+        """Return ``data`` serialized with ``serializer_name``."""
+        serializer = manager.serializer(serializer_name)
+        if serializer is None:
+            raise ValueError(
+                'Invalid serializer `{0}`. Register your serializer with '
+                '`manager.register()` first.'.format(serializer_name))
+
+        file_obj = BytesIO()
+        serializer.dump(data, file_obj)
+        return file_obj.getvalue()
+
+    def _deserialize(self, serializer_name, value):
+        """Load data serialized with ``serializer_name`` from ``value``."""
+        serializer = manager.serializer(serializer_name)
+        if serializer is None:
+            raise ValueError(
+                'Unknown serializer `{0}`. Register a corresponding '
+                'serializer with `manager.register()` '
+                'to load this data.'.format(serializer_name))
+
+        return serializer.load(BytesIO(value))
 
     def filter(self, query, items, key=lambda x: x, ascending=False,
                include_score=False, min_score=0, max_results=0,
-               match_on=MATCH_ALL, fold_diacritics=True):
+               match_on=MATCH_ALL, fold_diacritics=True, session=None,
+               parallel=False):
         """Fuzzy search filter. Returns list of ``items`` that match ``query``.
 
         ``query`` is case-insensitive. Any item that does not contain the
@@ -1909,11 +2774,12 @@ class Workflow(object):
 
         :param query: query to test items against
         :type query: ``unicode``
-        :param items: iterable of items to test
-        :type items: ``list`` or ``tuple``
+        :param items: iterable of items to test or a :class:`FilterIndex`
+            of them
+        :type items: ``list``, ``tuple`` or :class:`FilterIndex`
         :param key: function to get comparison key from ``items``.
             Must return a ``unicode`` string. The default simply returns
-            the item.
+            the item. Ignored if ``items`` is a :class:`FilterIndex`.
         :type key: ``callable``
         :param ascending: set to ``True`` to get worst matches first
         :type ascending: ``Boolean``
@@ -1932,6 +2798,19 @@ class Workflow(object):
         :param fold_diacritics: Convert search keys to ASCII-only
             characters if ``query`` only contains ASCII characters.
         :type fold_diacritics: ``Boolean``
+        :param session: Name of a filter session. The items matching
+            ``query`` are remembered (in the cache) under this name, and
+            if the next query of the session extends this one (e.g. the
+            user typed another character), only those items are tested
+            again. ``items`` must be in the same order every time; the
+            session starts afresh if the search keys have changed.
+        :type session: ``unicode``
+        :param parallel: Score ``items`` in this many processes (``True``
+            for one per CPU). Only used for at least
+            :const:`PARALLEL_MIN_ITEMS` items, as starting the processes
+            takes longer than filtering fewer items. The results are the
+            same as without ``parallel``.
+        :type parallel: ``int`` or ``Boolean``
         :returns: list of ``items`` matching ``query`` or list of
             ``(item, score, rule)`` `tuples` if ``include_score`` is ``True``.
             ``rule`` is the ``MATCH_*`` rule that matched the item.
@@ -2003,27 +2882,192 @@ class Workflow(object):
             raise ValueError('`query` contains only whitespace')
 
         # Use user override if there is one
-        fold_diacritics = self.settings.get('__workflow_diacritic_folding',
+        fold_diacritics = self._hot_setting('__workflow_diacritic_folding',
                                             fold_diacritics)
 
-        results = []
+        terms = None
+        matched = None
+        positions = None
+        known = None
+
+        words = [s.strip() for s in query.split(' ')]
+        words = [word for word in words if word != '']
 
-        for item in items:
+        if isinstance(items, FilterIndex):
+            entries = items.entries
+            # Query-dependent part of `_filter_item`, done once per word
+            terms = []
+            for word in words:
+                word = word.lower()
+                terms.append((word, frozenset(word), char_mask(word),
+                              fold_diacritics and isascii(word)))
+        elif session is not None or parallel:
+            entries = [(item, key(item).strip(), None, None)
+                       for item in items]
+        else:
+            entries = ((item, key(item).strip(), None, None)
+                       for item in items)
+
+        if session is not None:
+            state = {
+                'words': [word.lower() for word in words],
+                'match_on': match_on,
+                'fold_diacritics': fold_diacritics,
+                'fingerprint': (items.fingerprint
+                                if isinstance(items, FilterIndex) else
+                                key_fingerprint(e[1] for e in entries)),
+            }
+            positions = self._filter_session_candidates(session, state)
+            if positions is None:
+                candidates = enumerate(entries)
+            else:
+                candidates = ((pos, entries[pos]) for pos in positions)
+            matched = array(b'i')
+        else:
+            candidates = enumerate(entries)
+
+        if terms is not None and items.columns is not None:
+            positions, known = self._filter_columns(items, positions, terms,
+                                                    match_on)
+            candidates = ((pos, entries[pos]) for pos in positions)
+
+        if parallel is True:
+            parallel = multiprocessing.cpu_count()
+        if parallel > 1:
+            if positions is None:
+                positions = range(len(entries))
+            if len(positions) < PARALLEL_MIN_ITEMS:
+                parallel = False
+
+        if parallel > 1:
+            args = (words, terms, match_on, fold_diacritics, known,
+                    min_score, max_results, ascending)
+            results = self._filter_parallel(parallel, entries, positions,
+                                            args, matched)
+        else:
+            matches = self._filter_matches(candidates, words, terms,
+                                           match_on, fold_diacritics,
+                                           matched, known)
+            results = self._filter_select(matches, min_score, max_results,
+                                          ascending)
+
+        # discard the sort keys
+        results = [t[1] for t in results]
+
+        if session is not None:
+            state['candidates'] = matched
+            # Not `cache_data()`: the state must be saved whatever
+            # `cache_serializer` is
+            with atomic_writer(self._filter_session_path(session),
+                               'wb') as file_obj:
+                cPickle.dump(state, file_obj, protocol=-1)
+
+        # return list of ``(item, score, rule)``
+        if include_score:
+            return results
+        # just return list of items
+        return [t[0] for t in results]
+
+    def _filter_select(self, matches, min_score, max_results, ascending):
+        """Return the best ``(sort key, result)`` ``matches`` in order."""
+        if min_score:
+            matches = (m for m in matches if m[1][1] > min_score)
+
+        # sort on keys. Only the best `max_results` matches are kept
+        # if there is a limit
+        if max_results:
+            select = heapq.nlargest if ascending else heapq.nsmallest
+            return select(max_results, matches)
+
+        return sorted(matches, reverse=ascending)
+
+    def _filter_parallel(self, processes, entries, positions, args,
+                         matched):
+        """Run :meth:`_filter_matches` in ``processes`` processes.
+
+        ``entries`` at ``positions`` are split into one contiguous shard
+        per process. Each process returns its best matches (with items
+        replaced by their positions), which are merged here.
+
+        """
+        global _filter_job
+
+        size = -(-len(positions) // processes)
+        shards = [(start, start + size)
+                  for start in range(0, len(positions), size)]
+
+        self.logger.debug('filtering %d items in %d processes',
+                          len(positions), len(shards))
+
+        _filter_job = (self, entries, positions, args, matched is not None)
+        pool = multiprocessing.Pool(len(shards))
+        try:
+            shard_results = pool.map(_filter_shard, shards)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            _filter_job = None
+
+        matches = []
+        for results, shard_matched in shard_results:
+            for sort_key, (pos, score, rule) in results:
+                matches.append((sort_key, (entries[pos][0], score, rule)))
+            if matched is not None:
+                matched.extend(shard_matched)
+
+        max_results, ascending = args[-2:]
+        return self._filter_select(matches, None, max_results, ascending)
+
+    def _filter_matches(self, candidates, words, terms, match_on,
+                        fold_diacritics, matched, known=None):
+        """Generate ``(sort key, (item, score, rule))`` for matching items.
+
+        ``candidates`` are ``(position, entry)`` pairs, with entries as in
+        :attr:`FilterIndex.entries`. ``terms`` are the preprocessed
+        ``words`` if the entries are indexed. The positions of items that
+        match all ``words`` (even with a score of 0) are appended to
+        ``matched`` unless it is ``None``. ``known`` maps positions of
+        items already scored by :meth:`_filter_columns` to their score.
+
+        """
+        for pos, (item, value, plain, folded) in candidates:
             skip = False
             score = 0
-            words = [s.strip() for s in query.split(' ')]
-            value = key(item).strip()
+            # All words matched a rule, but maybe with a score of 0
+            ruled = True
             if value == '':
                 continue
-            for word in words:
-                if word == '':
-                    continue
-                s, rule = self._filter_item(value, word, match_on,
-                                            fold_diacritics)
 
-                if not s:  # Skip items that don't match part of the query
-                    skip = True
-                score += s
+            if known and pos in known:
+                score, rule = known[pos], MATCH_STARTSWITH
+            elif plain is None:
+                for word in words:
+                    s, rule = self._filter_item(value, word, match_on,
+                                                fold_diacritics)
+
+                    if not s:  # Skip items that don't match part of query
+                        skip = True
+                        ruled = ruled and rule is not None
+                    score += s
+            else:
+                for word, chars, mask, fold in terms:
+                    search_key = folded if fold else plain
+                    if mask & ~search_key.mask:
+                        s, rule = 0, None
+                    else:
+                        s, rule = self._match_key(search_key, word, chars,
+                                                  match_on)
+
+                    if not s:
+                        skip = True
+                        ruled = ruled and rule is not None
+                    score += s
+
+            if matched is not None and ruled:
+                matched.append(pos)
 
             if skip:
                 continue
@@ -2032,24 +3076,104 @@ class Workflow(object):
                 # use "reversed" `score` (i.e. highest becomes lowest) and
                 # `value` as sort key. This means items with the same score
                 # will be sorted in alphabetical not reverse alphabetical order
-                results.append(((100.0 / score, value.lower(), score),
-                                (item, score, rule)))
+                yield ((100.0 / score, value.lower(), score),
+                       (item, score, rule))
 
-        # sort on keys, then discard the keys
-        results.sort(reverse=ascending)
-        results = [t[1] for t in results]
+    def _filter_columns(self, index, positions, terms, match_on):
+        """Match ``terms`` against all of ``index``'s columns at once.
 
-        if min_score:
-            results = [r for r in results if r[1] > min_score]
+        Discards the items at ``positions`` (all items if ``None``) that
+        can't match every term and scores the items that start with every
+        term. The others are left to :meth:`_match_key`.
 
-        if max_results and len(results) > max_results:
-            results = results[:max_results]
+        :returns: ``(positions, known)``, the positions of the remaining
+            items and a ``{position: score}`` dict of scored items.
 
-        # return list of ``(item, score, rule)``
-        if include_score:
-            return results
-        # just return list of items
-        return [t[0] for t in results]
+        """
+        if positions is None:
+            positions = numpy.arange(len(index.entries))
+        else:
+            positions = numpy.array(positions, dtype=numpy.intp)
+
+        scores = numpy.zeros(len(positions))
+        known = numpy.ones(len(positions), dtype=bool)
+        # Items must start with or contain every word if there are no
+        # other rules
+        starting = not match_on & ~MATCH_STARTSWITH
+        contained = not match_on & ~(MATCH_STARTSWITH | MATCH_SUBSTRING)
+
+        for word, chars, mask, fold in terms:
+            codes, masks, lengths = index.columns['folded' if fold
+                                                  else 'plain']
+            mask = numpy.uint64(mask)
+            keep = (masks[positions] & mask) == mask
+            positions = positions[keep]
+            scores = scores[keep]
+            known = known[keep]
+            codes = codes[positions]
+
+            if match_on & MATCH_STARTSWITH:
+                starts = codes_match(codes, word)
+                # same as `_match_key`, including integer division
+                s = 100.0 - (lengths[positions] // len(word))
+                known &= starts & (s != 0)
+                scores += s
+            else:
+                known[:] = False
+
+            if starting:
+                keep = starts
+            elif contained:
+                keep = codes_match(codes, word, anywhere=True)
+            else:
+                continue
+
+            positions = positions[keep]
+            scores = scores[keep]
+            known = known[keep]
+
+        return (positions.tolist(),
+                dict(zip(positions[known].tolist(), scores[known].tolist())))
+
+    def _filter_session_path(self, session):
+        """Return path of the state of filter ``session``."""
+        return self.cachefile('__workflow_filter_{0}.cpickle'.format(session))
+
+    def _filter_session_candidates(self, session, state):
+        """Return positions of items to test for filter ``session``.
+
+        Returns ``None`` (test all items) unless the query in ``state``
+        extends the session's previous query and the other filter
+        settings are unchanged.
+
+        """
+        try:
+            with open(self._filter_session_path(session), 'rb') as file_obj:
+                previous = cPickle.load(file_obj)
+        except Exception:  # no session yet or unreadable
+            return None
+
+        for name in ('match_on', 'fold_diacritics', 'fingerprint'):
+            if previous[name] != state[name]:
+                return None
+
+        old, new = previous['words'], state['words']
+        if not old or len(new) < len(old) or old[:-1] != new[:len(old) - 1]:
+            return None
+
+        # The last word of the previous query may have been extended
+        last, extended = old[-1], new[len(old) - 1]
+        if last != extended:
+            if (not extended.startswith(last) or
+                    isascii(last) != isascii(extended)):
+                return None
+            if (state['match_on'] & ~PREFIX_CLOSED_RULES and not
+                    state['match_on'] & (MATCH_SUBSTRING | MATCH_ALLCHARS)):
+                return None
+
+        self.logger.debug('Filter session `%s` : testing %d items',
+                          session, len(previous['candidates']))
+        return previous['candidates']
 
     def _filter_item(self, value, query, match_on, fold_diacritics):
         """Filter ``value`` against ``query`` using rules ``match_on``.
@@ -2065,14 +3189,27 @@ class Workflow(object):
         if fold_diacritics:
             value = self.fold_to_ascii(value)
 
+        return self._match_key(SearchKey(value), query, set(query),
+                               match_on)
+
+    def _match_key(self, key, query, chars, match_on):
+        """Match :class:`SearchKey` ``key`` against lower-case ``query``.
+
+        ``chars`` is the set of characters in ``query``.
+
+        :returns: ``(score, rule)``
+
+        """
+        value = key.value
+
         # pre-filter any items that do not contain all characters
         # of ``query`` to save on running several more expensive tests
-        if not set(query) <= set(value.lower()):
+        if not chars <= key.chars:
 
             return (0, None)
 
         # item starts with query
-        if match_on & MATCH_STARTSWITH and value.lower().startswith(query):
+        if match_on & MATCH_STARTSWITH and key.lower.startswith(query):
             score = 100.0 - (len(value) / len(query))
 
             return (score, MATCH_STARTSWITH)
@@ -2080,7 +3217,7 @@ class Workflow(object):
         # query matches capitalised letters in item,
         # e.g. of = OmniFocus
         if match_on & MATCH_CAPITALS:
-            initials = ''.join([c for c in value if c in INITIALS])
+            initials = key.capitals
             if initials.lower().startswith(query):
                 score = 100.0 - (len(initials) / len(query))
 
@@ -2091,10 +3228,9 @@ class Workflow(object):
         if (match_on & MATCH_ATOM or
                 match_on & MATCH_INITIALS_CONTAIN or
                 match_on & MATCH_INITIALS_STARTSWITH):
-            atoms = [s.lower() for s in split_on_delimiters(value)]
-            # print('atoms : %s  -->  %s' % (value, atoms))
+            atoms = key.atoms
             # initials of the atoms
-            initials = ''.join([s[0] for s in atoms if s])
+            initials = key.initials
 
         if match_on & MATCH_ATOM:
             # is `query` one of the atoms in item?
@@ -2124,7 +3260,7 @@ class Workflow(object):
             return (score, MATCH_INITIALS_CONTAIN)
 
         # `query` is a substring of item
-        if match_on & MATCH_SUBSTRING and query in value.lower():
+        if match_on & MATCH_SUBSTRING and query in key.lower:
             score = 90.0 - (len(value) / len(query))
 
             return (score, MATCH_SUBSTRING)
@@ -2158,7 +3294,7 @@ class Workflow(object):
         self._search_pattern_cache[query] = search
         return search
 
-    def run(self, func, text_errors=False):
+    def run(self, func, text_errors=False, budget=None):
         """Call ``func`` to run your workflow.
 
         :param func: Callable to call with ``self`` (i.e. the :class:`Workflow`
@@ -2168,6 +3304,21 @@ class Workflow(object):
             running Alfred-Workflow in a Script Filter and would like
             to pass the error message to, say, a notification.
         :type text_errors: ``Boolean``
+        :param budget: Wall-clock time budget for the run in seconds.
+            While ``func`` runs, :attr:`deadline` is set and every
+            request made with :mod:`~workflow.web` draws from it. Requests
+            made once it has run out raise
+            :class:`~workflow.web.DeadlineExceeded`, so ``func`` can
+            fall back to cached or placeholder data instead of blocking.
+        :type budget: ``float``
+
+        Changes to :attr:`settings` made while ``func`` runs are saved
+        in one go when it has finished.
+
+        If :attr:`cache_manager` is set, expired and over-quota cache
+        files are evicted (within what is left of ``budget``) after
+        ``func`` has finished. So are expired entries in
+        :attr:`cache_store` if ``func`` used it.
 
         ``func`` will be called with :class:`Workflow` instance as first
         argument.
@@ -2180,6 +3331,15 @@ class Workflow(object):
         """
         start = time.time()
 
+        if budget:
+            import web
+            self.deadline = web.Deadline(budget)
+            web.set_deadline(self.deadline)
+
+        self._running = True
+        if self._settings is not None:
+            self._settings.autosave = False
+
         # Call workflow's entry function/method within a try-except block
         # to catch any errors and display an error message in Alfred
         try:
@@ -2227,6 +3387,29 @@ class Workflow(object):
             return 1
 
         finally:
+            self._running = False
+            if self._settings is not None:
+                self._settings.autosave = True
+                try:
+                    self._settings.save()
+                    # Pass changes on to the next run
+                    self._load_snapshot()
+                except Exception as err:
+                    self.logger.exception(err)
+            if self.cache_manager is not None:
+                try:
+                    self.cache_manager.evict(deadline=self.deadline)
+                    self.cache_manager.save()
+                except Exception as err:
+                    self.logger.exception(err)
+            if self.cache_store is not None and self.cache_store.is_open:
+                try:
+                    self.cache_store.evict()
+                except Exception as err:
+                    self.logger.exception(err)
+            if budget:
+                web.set_deadline(None)
+                self.deadline = None
             self.logger.debug('Workflow finished in {0:0.3f} seconds.'.format(
                 time.time() - start))
 
@@ -2347,7 +3530,7 @@ class Workflow(object):
         """
         if self._last_version_run is UNSET:
 
-            version = self.settings.get('__workflow_last_version')
+            version = self._hot_setting('__workflow_last_version')
             if version:
                 from update import Version
                 version = Version(version)
@@ -2382,6 +3565,9 @@ class Workflow(object):
             from update import Version
             version = Version(version)
 
+        if self._hot_setting('__workflow_last_version') == str(version):
+            return True
+
         self.settings['__workflow_last_version'] = str(version)
 
         self.logger.debug('Set last run version : {0}'.format(version))
@@ -2400,13 +3586,13 @@ class Workflow(object):
         :returns: ``True`` if an update is available, else ``False``
 
         """
-        update_data = self.cached_data('__workflow_update_status', max_age=0)
-        self.logger.debug('update_data : {0}'.format(update_data))
+        available = self._load_snapshot()['update_available']
+        self.logger.debug('update available : {0}'.format(available))
 
-        if not update_data or not update_data.get('available'):
+        if not available:
             return False
 
-        return update_data['available']
+        return available
 
     @property
     def prereleases(self):
@@ -2422,7 +3608,7 @@ class Workflow(object):
         if self._update_settings.get('prereleases'):
             return True
 
-        return self.settings.get('__workflow_prereleases') or False
+        return self._hot_setting('__workflow_prereleases') or False
 
     def check_update(self, force=False):
         """Call update script if it's time to check for a new release.
@@ -2442,13 +3628,14 @@ class Workflow(object):
         frequency = self._update_settings.get('frequency',
                                               DEFAULT_UPDATE_FREQUENCY)
 
-        if not force and not self.settings.get('__workflow_autoupdate', True):
+        if not force and not self._hot_setting('__workflow_autoupdate', True):
             self.logger.debug('Auto update turned off by user')
             return
 
         # Check for new version if it's time
-        if (force or not self.cached_data_fresh(
-                '__workflow_update_status', frequency * 86400)):
+        checked = self._load_snapshot()['status_mtime']
+        if (force or checked is None or
+                time.time() - checked >= frequency * 86400):
 
             github_slug = self._update_settings['github_slug']
             # version = self._update_settings['version']
@@ -2738,6 +3925,11 @@ class Workflow(object):
             By default, *all* files will be deleted.
         :type filter_func: ``callable``
         """
+        if self.cache_store is not None:
+            self.cache_store.close()
+        if self.cache_manager is not None:
+            self.cache_manager.reset()
+        self._cache_memo.clear()
         self._delete_directory_contents(self.cachedir, filter_func)
 
     def clear_data(self, filter_func=lambda f: True):
@@ -2750,6 +3942,8 @@ class Workflow(object):
             By default, *all* files will be deleted.
         :type filter_func: ``callable``
         """
+        if self.data_store is not None:
+            self.data_store.close()
         self._delete_directory_contents(self.datadir, filter_func)
 
     def clear_settings(self):
@@ -2847,11 +4041,7 @@ class Workflow(object):
         :rtype: ``unicode``
 
         """
-        if isascii(text):
-            return text
-        text = ''.join([ASCII_REPLACEMENTS.get(c, c) for c in text])
-        return unicode(unicodedata.normalize('NFKD',
-                       text).encode('ascii', 'ignore'))
+        return fold_to_ascii(text)
 
     def dumbify_punctuation(self, text):
         """Convert non-ASCII punctuation to closest ASCII equivalent.
@@ -373,6 +373,19 @@ class Workflow3(Workflow):
         """
         self._rerun = seconds
 
+    def revalidate(self, name, cmd):
+        """Refresh cache ``name`` in the background by running ``cmd``.
+
+        Also sets :attr:`rerun` (unless it's already set) while the
+        refresh is running, so Alfred runs the Script Filter again and
+        picks up the refreshed data.
+        """
+        running = super(Workflow3, self).revalidate(name, cmd)
+        if running and not self.rerun:
+            self.rerun = 1
+
+        return running
+
     def setvar(self, name, value):
         """Set a "global" workflow variable.
 
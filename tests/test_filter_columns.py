@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""Compare the NumPy and pure-Python paths of `Workflow.filter`."""
+
+from __future__ import print_function, unicode_literals
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from workflow import Workflow  # noqa: E402
+from workflow import workflow  # noqa: E402
+
+ITEMS = [
+    'Dune', 'Emma', 'Dune Messiah', 'The Lord of the Rings', 'a', 'b',
+    'Brontë Sisters', 'Café Society', 'Harry Potter', 'harry', 'Ærø',
+    'How I Met Your Mother', 'x-ray', 'OmniFocus', 'Über', 'aa',
+]
+
+QUERIES = [
+    'd', 'du', 'dune', 'dunedune', 'a', 'aa', 'aaa', 'b', 'bb', 'cafe',
+    'café', 'ha', 'harry p', 'himym', 'of', 'lotr', 'ub', 'über', 'xr',
+    'the lord of the rings and more', 'zzzzzzzzzzzzzzzzzzzzzzzzzzzzz',
+]
+
+MATCH_ONS = (
+    workflow.MATCH_ALL,
+    workflow.MATCH_STARTSWITH,
+    workflow.MATCH_STARTSWITH | workflow.MATCH_SUBSTRING,
+    workflow.MATCH_SUBSTRING,
+    workflow.MATCH_ALL ^ workflow.MATCH_STARTSWITH,
+)
+
+
+@unittest.skipIf(workflow.numpy is None, 'NumPy is not installed')
+class FilterColumnsTests(unittest.TestCase):
+    """Vectorized filter returns the same as pure-Python filter."""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        os.environ['alfred_workflow_bundleid'] = 'net.deanishe.test'
+        os.environ['alfred_workflow_cache'] = self.tempdir
+        os.environ['alfred_workflow_data'] = self.tempdir
+        self.wf = Workflow()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def _compare(self, items, queries):
+        plain = workflow.FilterIndex(items, vectorize=False)
+        vectorized = workflow.FilterIndex(items)
+        self.assertIsNone(plain.columns)
+        self.assertIsNotNone(vectorized.columns)
+        for query in queries:
+            for match_on in MATCH_ONS:
+                for fold in (True, False):
+                    args = dict(match_on=match_on, fold_diacritics=fold,
+                                include_score=True)
+                    self.assertEqual(
+                        self.wf.filter(query, vectorized, **args),
+                        self.wf.filter(query, plain, **args),
+                        (query, match_on, fold))
+
+    def test_filter(self):
+        """Vectorized filter"""
+        self._compare(ITEMS, QUERIES)
+
+    def test_query_longer_than_keys(self):
+        """Query word longer than every key"""
+        self._compare(['Dune', 'Emma'], ['dunedune', 'dune dunedune'])
+        self.assertEqual(
+            self.wf.filter('dunedune', workflow.FilterIndex(['Dune'])), [])
+
+    def test_width_one(self):
+        """Keys of a single character"""
+        self._compare(['a', 'b', 'A'], ['a', 'aa', 'ab', 'a a'])
+        self.assertEqual(
+            self.wf.filter('aa', workflow.FilterIndex(['a', 'b'])), [])
+
+    def test_codes_match(self):
+        """codes_match"""
+        codes = workflow.encode_codes(['dune', 'emma', 'a'])
+        self.assertEqual(
+            workflow.codes_match(codes, 'dunedune').tolist(),
+            [False, False, False])
+        self.assertEqual(
+            workflow.codes_match(codes, 'un', anywhere=True).tolist(),
+            [True, False, False])
+        self.assertEqual(
+            workflow.codes_match(codes, 'a').tolist(),
+            [False, False, True])
+        codes = workflow.encode_codes(['a', 'b'])
+        self.assertEqual(workflow.codes_match(codes, 'aa').tolist(),
+                         [False, False])
+        self.assertEqual(
+            workflow.codes_match(codes, 'aa', anywhere=True).tolist(),
+            [False, False])
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""Compare `Workflow.filter` with and without ``parallel``."""
+
+from __future__ import print_function, unicode_literals
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from workflow import Workflow  # noqa: E402
+from workflow import workflow  # noqa: E402
+
+WORDS = [
+    'harry', 'potter', 'Stephen', 'King', 'The', 'Dukes', 'of', 'Hazzard',
+    'OmniFocus', 'Brontë', 'café', 'Ærø', 'über', 'Sherlock', 'Holmes',
+    '2001', 'A', 'Space', 'Odyssey', 'how', 'I', 'met', 'your', 'mother',
+    'x-ray', 'naïve', 'Zoë',
+]
+
+QUERIES = ['h', 'harry po', 'hp', 'of', 'zoë', 'café', 'the dukes', 'e e']
+
+OPTIONS = (
+    {},
+    {'ascending': True},
+    {'max_results': 7, 'min_score': 30},
+    {'max_results': 5, 'ascending': True},
+)
+
+
+def items(count):
+    """Return ``count`` titles, some with trailing space, plus blanks."""
+    rand = random.Random(42)
+    titles = []
+    for _ in range(count):
+        title = ' '.join(rand.choice(WORDS)
+                         for _ in range(rand.randint(1, 5)))
+        if rand.random() < 0.1:
+            title += ' '
+        titles.append(title)
+    return titles + ['', '   ']
+
+
+class FilterParallelTests(unittest.TestCase):
+    """Filtering in several processes returns the same as in one."""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        os.environ['alfred_workflow_bundleid'] = 'net.deanishe.test'
+        os.environ['alfred_workflow_cache'] = self.tempdir
+        os.environ['alfred_workflow_data'] = self.tempdir
+        self.wf = Workflow()
+        self.items = items(1000)
+        # Split small item sets too
+        self.min_items = workflow.PARALLEL_MIN_ITEMS
+        workflow.PARALLEL_MIN_ITEMS = 100
+
+    def tearDown(self):
+        workflow.PARALLEL_MIN_ITEMS = self.min_items
+        shutil.rmtree(self.tempdir)
+
+    def _compare(self, items, key=lambda x: x):
+        for query in QUERIES:
+            for match_on in (workflow.MATCH_ALL, workflow.MATCH_STARTSWITH):
+                for options in OPTIONS:
+                    args = dict(key=key, match_on=match_on,
+                                include_score=True, **options)
+                    serial = self.wf.filter(query, items, **args)
+                    parallel = self.wf.filter(query, items, parallel=3,
+                                              **args)
+                    self.assertEqual(parallel, serial,
+                                     (query, match_on, options))
+                    # The very same objects, not copies
+                    for a, b in zip(parallel, serial):
+                        self.assertIs(a[0], b[0])
+
+    def test_list(self):
+        """Parallel filter of a list"""
+        self._compare(self.items)
+
+    def test_index(self):
+        """Parallel filter of a FilterIndex"""
+        self._compare(workflow.FilterIndex(self.items))
+
+    def test_key(self):
+        """Parallel filter of dicts with a key function"""
+        self._compare([{'title': title} for title in self.items],
+                      key=lambda d: d['title'])
+
+    def test_session(self):
+        """Parallel filter in a session"""
+        for query in ('h', 'ha', 'har', 'harry', 'harry p'):
+            self.assertEqual(
+                self.wf.filter(query, self.items, include_score=True,
+                               parallel=2, session='test'),
+                self.wf.filter(query, self.items, include_score=True))
+
+    def test_below_threshold(self):
+        """Few items are filtered in one process"""
+        workflow.PARALLEL_MIN_ITEMS = 10000
+        self.assertEqual(self.wf.filter('harry', self.items, parallel=3),
+                         self.wf.filter('harry', self.items))
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""Compare `Workflow.filter` with and without a ``session``."""
+
+from __future__ import print_function, unicode_literals
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from workflow import Workflow  # noqa: E402
+from workflow import workflow  # noqa: E402
+
+WORDS = [
+    'harry', 'potter', 'Stephen', 'King', 'The', 'Dukes', 'of', 'Hazzard',
+    'OmniFocus', 'Brontë', 'café', 'Ærø', 'über', 'Sherlock', 'Holmes',
+    '2001', 'A', 'Space', 'Odyssey', 'how', 'I', 'met', 'your', 'mother',
+    'x-ray', 'naïve', 'Zoë',
+]
+
+
+def typed(text):
+    """Queries typed on the way to ``text``."""
+    return [text[:i] for i in range(1, len(text) + 1)]
+
+
+# Query sequences as typed in one session. The last two go back to a
+# shorter query, so the previous matches can't be narrowed.
+SEQUENCES = [
+    typed('harry potter'), typed('the lord'), typed('sn'), typed('café k'),
+    typed('abc'), ['ha', 'h', 'har'], typed('tlo'), typed('mi ha'),
+]
+
+MATCH_ONS = (
+    workflow.MATCH_ALL,
+    workflow.MATCH_ATOM,
+    workflow.MATCH_ATOM | workflow.MATCH_STARTSWITH,
+    workflow.MATCH_CAPITALS | workflow.MATCH_INITIALS,
+    workflow.MATCH_STARTSWITH | workflow.MATCH_SUBSTRING,
+)
+
+
+def items(count):
+    """Return ``count`` titles, some with trailing space, plus blanks."""
+    rand = random.Random(42)
+    titles = []
+    for _ in range(count):
+        title = ' '.join(rand.choice(WORDS)
+                         for _ in range(rand.randint(1, 5)))
+        if rand.random() < 0.1:
+            title += ' '
+        titles.append(title)
+    return titles + ['', '   ']
+
+
+class FilterSessionTests(unittest.TestCase):
+    """Filtering in a session returns the same as filtering afresh."""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        os.environ['alfred_workflow_bundleid'] = 'net.deanishe.test'
+        os.environ['alfred_workflow_cache'] = self.tempdir
+        os.environ['alfred_workflow_data'] = self.tempdir
+        self.wf = Workflow()
+        self.items = items(300)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def _compare(self, items):
+        for match_on in MATCH_ONS:
+            for fold in (True, False):
+                for sequence in SEQUENCES:
+                    for query in sequence:
+                        args = dict(match_on=match_on, fold_diacritics=fold,
+                                    include_score=True)
+                        self.assertEqual(
+                            self.wf.filter(query, items, session='test',
+                                           **args),
+                            self.wf.filter(query, items, **args),
+                            (query, match_on, fold))
+
+    def test_list(self):
+        """Session filter of a list"""
+        self._compare(self.items)
+
+    def test_index(self):
+        """Session filter of a FilterIndex"""
+        self._compare(workflow.FilterIndex(self.items))
+
+    def test_json_serializer(self):
+        """Session state with the JSON cache serializer"""
+        self.wf.cache_serializer = 'json'
+        self._compare(self.items)
+
+    def test_items_changed(self):
+        """Session isn't used for different items"""
+        for query in typed('harry'):
+            self.wf.filter(query, self.items, session='test')
+        other = items(200)
+        self.assertEqual(self.wf.filter('harry p', other, session='test'),
+                         self.wf.filter('harry p', other))
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()